@@ -1,9 +1,1987 @@
-from datetime import date, datetime, timezone
+from array import array
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, fields as dataclass_fields
+from datetime import date, datetime, timedelta, timezone
 from dateutil import tz
+from email.utils import parsedate_to_datetime
+from enum import Enum
+from functools import partial
 from dateutil.relativedelta import relativedelta
+from hashlib import sha256
+from itertools import compress, islice, repeat
+from pathlib import Path
+from threading import BoundedSemaphore, Lock
+from typing import TypedDict
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+import bz2
+import gzip
 import json
+import mmap
+import operator
+import os
+import random
 import requests
 import re
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class HTTPCache:
+    """
+    A persistent on-disk cache of HTTP response bodies keyed by URL. Each entry
+    stores the raw body alongside the ETag and Last-Modified validators returned by
+    the server and the time it was fetched, so that stale entries can be revalidated
+    with a conditional request instead of downloaded again in full.
+    """
+
+    def __init__(self, directory) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _paths(self, url: str) -> tuple:
+        key = sha256(url.encode("utf-8")).hexdigest()
+        return self.directory / f"{key}.body", self.directory / f"{key}.json"
+
+    def get(self, url: str):
+        """
+        Returns a tuple of (body, metadata) for the cached URL, or None if the URL
+        has not been cached yet.
+        """
+        body_path, meta_path = self._paths(url)
+        try:
+            meta = json.loads(meta_path.read_text())
+            body = body_path.read_bytes()
+        except (FileNotFoundError, ValueError):
+            return None
+        return body, meta
+
+    def _write_meta(self, url: str, response_headers, encoding: str) -> None:
+        meta = {
+            "url": url,
+            "etag": response_headers.get("ETag"),
+            "last_modified": response_headers.get("Last-Modified"),
+            "encoding": encoding or "utf-8",
+            "fetched_at": datetime.now(timezone.utc).timestamp(),
+        }
+        meta_path = self._paths(url)[1]
+        tmp_path = meta_path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(meta))
+        os.replace(tmp_path, meta_path)
+
+    def put(self, url: str, body: bytes, response_headers, encoding: str) -> None:
+        """
+        Stores a response body and its validators. Files are written to a temporary
+        name and then moved into place so that a crashed run never leaves a
+        half-written entry behind.
+        """
+        body_path = self._paths(url)[0]
+        tmp_path = body_path.with_suffix(".body.tmp")
+        tmp_path.write_bytes(body)
+        os.replace(tmp_path, body_path)
+        self._write_meta(url, response_headers, encoding)
+
+    def put_stream(self, url: str, chunks, response_headers, encoding: str):
+        """
+        Generator counterpart of put for streamed responses. Passes each chunk
+        through unchanged while appending it to a temporary file, and only commits
+        the entry once the stream has been read to the end.
+        """
+        body_path = self._paths(url)[0]
+        tmp_path = body_path.with_suffix(".body.tmp")
+        with open(tmp_path, "wb") as body_file:
+            for chunk in chunks:
+                body_file.write(chunk)
+                yield chunk
+        os.replace(tmp_path, body_path)
+        self._write_meta(url, response_headers, encoding)
+
+    def touch(self, url: str) -> None:
+        """
+        Marks a cached entry as freshly validated after the server answered a
+        conditional request with 304 Not Modified.
+        """
+        entry = self.get(url)
+        if entry is None:
+            return
+        body_path, meta_path = self._paths(url)
+        meta = entry[1]
+        meta["fetched_at"] = datetime.now(timezone.utc).timestamp()
+        tmp_path = meta_path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(meta))
+        os.replace(tmp_path, meta_path)
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket. Tokens are added at rate per second up to capacity,
+    and every request takes one, waiting for it if the bucket is empty. pause()
+    holds back every request on the bucket until a given time, which is how a
+    server's Retry-After is honoured by all the threads talking to that host.
+    """
+
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._resume_at = 0.0
+        self._lock = Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._resume_at:
+                    self.tokens = min(
+                        self.capacity, self.tokens + (now - self._updated) * self.rate
+                    )
+                    self._updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self._resume_at - now
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+            # Nothing accumulates while the host has asked us to back off
+            self.tokens = 0
+            self._updated = self._resume_at
+
+
+class RequestScheduler:
+    """
+    Sends requests through per-host token buckets and retries the ones the server
+    turns away. Responses with a status in RETRY_STATUSES, as well as connection
+    errors and timeouts, are retried up to max_retries times. The wait before a
+    retry is the server's Retry-After when it gives one, and otherwise a jittered
+    exponential backoff starting at backoff seconds and capped at max_backoff.
+
+    rate is the default number of requests per second allowed to each host (None
+    for no limit), host_rates overrides it for individual hosts, and burst is the
+    bucket capacity.
+    """
+
+    RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+    def __init__(
+        self,
+        rate: float = None,
+        burst: float = None,
+        host_rates: dict = None,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.host_rates = host_rates or {}
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._buckets = {}
+        self._lock = Lock()
+
+    def bucket(self, url: str):
+        """
+        Returns the token bucket for the URL's host, or None if it is not limited.
+        """
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._buckets:
+                rate = self.host_rates.get(host, self.rate)
+                self._buckets[host] = (
+                    TokenBucket(rate, self.burst) if rate is not None else None
+                )
+            return self._buckets[host]
+
+    def _backoff_delay(self, attempt: int) -> float:
+        # "Full jitter": a uniformly random wait up to the exponential backoff, so
+        # parallel workers that were throttled together do not retry together
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    def _retry_after(self, response):
+        value = response.headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            # "-0000" dates come back naive; they are in UTC all the same
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    def send(self, url: str, send_request):
+        """
+        Calls send_request (a function taking no arguments that performs the request
+        for url and returns the response) under the host's rate limit, retrying it
+        as described above. Returns the final response, which may still carry an
+        error status once the retries are used up.
+        """
+        bucket = self.bucket(url)
+        attempt = 0
+        while True:
+            if bucket is not None:
+                bucket.acquire()
+            try:
+                response = send_request()
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self._backoff_delay(attempt))
+                attempt += 1
+                continue
+            if (
+                response.status_code not in self.RETRY_STATUSES
+                or attempt >= self.max_retries
+            ):
+                return response
+            delay = self._retry_after(response)
+            if delay is None:
+                delay = self._backoff_delay(attempt)
+            response.close()
+            if bucket is not None:
+                bucket.pause(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+
+
+class HTTPSession:
+    """
+    A pooled, keep-alive HTTP session shared by the parsers. Connections to a host
+    are reused between calls instead of paying for a new TCP and TLS handshake on
+    every request. pool_size is the number of connections kept open per host and
+    should be at least as large as the number of workers used by the concurrent
+    fetchers.
+
+    Every request goes through a RequestScheduler, which applies per-host rate
+    limits and retries throttled requests. The default scheduler does not limit the
+    rate but still retries 429s and transient errors.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        connect_timeout: float = 10,
+        read_timeout: float = 60,
+        session: requests.Session = None,
+        cache: HTTPCache = None,
+        scheduler: RequestScheduler = None,
+    ) -> None:
+        self.pool_size = pool_size
+        self.cache = cache
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = session if session is not None else requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url: str, headers: dict = None, params: dict = None, stream=False):
+        """
+        Issues a GET request over the pooled connections, using the configured
+        timeouts, rate limits and retries. Returns the requests.Response object.
+        """
+        return self.scheduler.send(
+            url,
+            lambda: self.session.get(
+                url=url,
+                headers=headers,
+                params=params,
+                timeout=self.timeout,
+                stream=stream,
+            ),
+        )
+
+    def _lookup(self, cache_key: str, headers: dict, immutable_after: datetime):
+        """
+        Looks a URL up in the cache. Returns a tuple of (entry, fresh, headers) where
+        fresh says whether the entry can be used without asking the server, and
+        headers carries the validators for a conditional request otherwise.
+        """
+        entry = self.cache.get(cache_key)
+        if entry is None:
+            return None, False, headers
+        meta = entry[1]
+        if immutable_after is not None and (
+            meta["fetched_at"] >= immutable_after.timestamp()
+        ):
+            return entry, True, headers
+        headers = dict(headers or {})
+        if meta["etag"]:
+            headers["If-None-Match"] = meta["etag"]
+        if meta["last_modified"]:
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return entry, False, headers
+
+    def _get_body(
+        self, url: str, headers: dict, params: dict, immutable_after: datetime
+    ) -> tuple:
+        """
+        Returns the (raw body, encoding) of a URL, going through the cache as
+        described in get_text. The encoding is None when the server gave none.
+        """
+        if self.cache is None:
+            response = self.get(url=url, headers=headers, params=params)
+            response.raise_for_status()
+            return response.content, response.encoding
+
+        cache_key = requests.Request("GET", url, params=params).prepare().url
+        entry, fresh, headers = self._lookup(cache_key, headers, immutable_after)
+        if fresh:
+            return entry[0], entry[1]["encoding"]
+
+        response = self.get(url=url, headers=headers, params=params)
+        if response.status_code == 304 and entry is not None:
+            self.cache.touch(cache_key)
+            return entry[0], entry[1]["encoding"]
+        response.raise_for_status()
+        self.cache.put(cache_key, response.content, response.headers, response.encoding)
+        return response.content, response.encoding
+
+    def get_text(
+        self,
+        url: str,
+        headers: dict = None,
+        params: dict = None,
+        immutable_after: datetime = None,
+    ) -> str:
+        """
+        Fetches the body of a URL as text, going through the on-disk cache when one
+        is configured. A cached entry that was fetched at or after immutable_after is
+        trusted as final and returned without touching the network (this is how
+        past monthly archives are handled). Any other cached entry is revalidated
+        with If-None-Match/If-Modified-Since and only downloaded again if the server
+        reports that it changed.
+        """
+        content, encoding = self._get_body(url, headers, params, immutable_after)
+        return str(content, encoding or "utf-8", errors="replace")
+
+    def get_content(
+        self,
+        url: str,
+        headers: dict = None,
+        params: dict = None,
+        immutable_after: datetime = None,
+    ) -> bytes:
+        """
+        Same as get_text, but returns the raw body without decoding it.
+        """
+        return self._get_body(url, headers, params, immutable_after)[0]
+
+    def iter_content(
+        self,
+        url: str,
+        headers: dict = None,
+        params: dict = None,
+        immutable_after: datetime = None,
+        chunk_size: int = 65536,
+    ):
+        """
+        Streaming counterpart of get_text. Yields the raw body of a URL in chunks of
+        bytes as they arrive from the network, following the same caching rules.
+        Streamed bodies are written to the cache as they are read rather than being
+        buffered in memory.
+        """
+        if self.cache is None:
+            with self.get(
+                url=url, headers=headers, params=params, stream=True
+            ) as response:
+                response.raise_for_status()
+                yield from response.iter_content(chunk_size)
+            return
+
+        cache_key = requests.Request("GET", url, params=params).prepare().url
+        entry, fresh, headers = self._lookup(cache_key, headers, immutable_after)
+        if fresh:
+            yield entry[0]
+            return
+
+        with self.get(url=url, headers=headers, params=params, stream=True) as response:
+            if response.status_code == 304 and entry is not None:
+                self.cache.touch(cache_key)
+                yield entry[0]
+                return
+            response.raise_for_status()
+            yield from self.cache.put_stream(
+                cache_key,
+                response.iter_content(chunk_size),
+                response.headers,
+                response.encoding,
+            )
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_default_session = None
+_default_session_lock = Lock()
+
+
+def get_default_session() -> HTTPSession:
+    """
+    Returns the module-wide HTTPSession that parsers use when none is passed in,
+    creating it on first use. Sharing it means that syncing many users, across both
+    chess.com and lichess.org, reuses the same open connections.
+    """
+    global _default_session
+    with _default_session_lock:
+        if _default_session is None:
+            _default_session = HTTPSession()
+        return _default_session
+
+
+class HostLimiter:
+    """
+    Caps the number of requests that may be in flight to any single host at once.
+    Used by the concurrent fetchers so that a large worker pool does not open more
+    simultaneous connections to one server than it is willing to accept.
+    """
+
+    def __init__(self, per_host_limit: int) -> None:
+        self.per_host_limit = per_host_limit
+        self._semaphores = {}
+        self._lock = Lock()
+
+    def __call__(self, url: str) -> BoundedSemaphore:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = BoundedSemaphore(self.per_host_limit)
+            return self._semaphores[host]
+
+
+class PGNSplitter:
+    """
+    Incrementally splits a multi-game PGN byte stream into individual games. Chunks
+    are fed in as they arrive and every game whose end has been seen is returned
+    straight away, with the separator searched for across chunk edges, so only the
+    game currently being received is held in the buffer.
+
+    By default games are separated by the blank lines chess.com puts between them.
+    keep is the number of trailing bytes of the separator that belong to the start
+    of the next game rather than to the gap between games.
+    """
+
+    def __init__(self, separator: bytes = b"\n\n\n", keep: int = 0) -> None:
+        self.separator = separator
+        self.keep = keep
+        self._buffer = bytearray()
+        self._scan_from = 0
+
+    def _decode(self, raw) -> str:
+        return bytes(raw).decode("utf-8").strip()
+
+    def feed(self, chunk: bytes) -> list:
+        """
+        Adds a chunk to the buffer and returns the list of games completed by it.
+        """
+        self._buffer += chunk
+        games = []
+        start = 0
+        while True:
+            index = self._buffer.find(self.separator, max(start, self._scan_from))
+            if index == -1:
+                break
+            game = self._decode(self._buffer[start:index])
+            if game:
+                games.append(game)
+            start = index + len(self.separator) - self.keep
+        del self._buffer[:start]
+        # The next search only needs to cover what arrives with the next chunk, plus
+        # enough of the current tail to catch a separator split between the two
+        self._scan_from = max(0, len(self._buffer) - len(self.separator) + 1)
+        return games
+
+    def flush(self) -> list:
+        """
+        Returns the final game left in the buffer once the stream has ended.
+        """
+        game = self._decode(self._buffer)
+        self._buffer = bytearray()
+        self._scan_from = 0
+        return [game] if game else []
+
+
+def split_pgn_stream(chunks, separator: bytes = b"\n\n\n", keep: int = 0):
+    """
+    Generator that yields each game of a multi-game PGN stream, given as an iterable
+    of byte chunks, as soon as it is complete.
+    """
+    splitter = PGNSplitter(separator, keep)
+    for chunk in chunks:
+        yield from splitter.feed(chunk)
+    yield from splitter.flush()
+
+
+RESULT_TOKENS = frozenset({"1-0", "0-1", "1/2-1/2", "*"})
+TAG_PATTERN = re.compile(r'\[(\w+)\s"([^"]+)"\]')
+ESCAPED_TAG_PATTERN = re.compile(r'\[(\w+)\s+"([^"\\]*(?:\\.[^"\\]*)*)"\]')
+CLOCK_PATTERN = re.compile(r"\[%clk\s+([^\]\s]+)\s*\]")
+# A move number glued to its move, as in "12.e4" or "12...e5"
+GLUED_MOVE_NUMBER_PATTERN = re.compile(r"\d\.+[^.\s]")
+BYTES_TAG_PATTERN = re.compile(rb'\[(\w+)\s"([^"]+)"\]')
+BYTES_ESCAPED_TAG_PATTERN = re.compile(rb'\[(\w+)\s+"([^"\\]*(?:\\.[^"\\]*)*)"\]')
+BYTES_NON_SPACE_PATTERN = re.compile(rb"\S")
+
+
+GAME_START = b"[Event "
+
+
+def _buffer_find(buffer):
+    # Returns a find(sub, start, end) for any buffer. memoryviews have no find
+    # method, but the regex engine can scan any buffer
+    if not isinstance(buffer, memoryview):
+        return buffer.find
+    searches = {}
+
+    def find(sub, start, end):
+        search = searches.get(sub)
+        if search is None:
+            search = searches[sub] = re.compile(re.escape(sub)).search
+        match = search(buffer, start, end)
+        return -1 if match is None else match.start()
+
+    return find
+
+
+def iter_pgn_slices(buffer, start: int = 0, end: int = None, crlf: bool = False):
+    """
+    Yields the (start, end) byte offsets of every game in a buffer (bytes, a
+    memoryview or an mmap) holding a multi-game PGN file. Games are found by the
+    blank line followed by an [Event tag that starts each one, so the scan works on
+    the raw bytes and nothing is decoded.
+    """
+    newline = b"\r\n" if crlf else b"\n"
+    separator = newline + newline + GAME_START
+    keep = len(GAME_START)
+    end = len(buffer) if end is None else end
+    find = _buffer_find(buffer)
+    while start < end:
+        index = find(separator, start, end)
+        if index == -1:
+            yield start, end
+            return
+        yield start, index
+        start = index + len(separator) - keep
+
+
+def iter_pgn_file(path):
+    """
+    Yields each game of a PGN file on disk as a string, ready to be used as the
+    source of a parser's pipeline or fed to iter_extract. The file is memory-mapped
+    and scanned for game boundaries with iter_pgn_slices, and only one game at a
+    time is copied out and decoded, so files larger than RAM can be read; the
+    kernel pages the mapping in and out as the scan moves through it.
+    """
+    with open(path, "rb") as pgn_file:
+        if os.fstat(pgn_file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(pgn_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            if hasattr(buffer, "madvise"):
+                buffer.madvise(mmap.MADV_SEQUENTIAL)
+            start = 3 if buffer[:3] == b"\xef\xbb\xbf" else 0
+            crlf = buffer.find(b"\r\n", start, start + 65536) != -1
+            for game_start, game_end in iter_pgn_slices(buffer, start, crlf=crlf):
+                game = buffer[game_start:game_end].decode("utf-8").strip()
+                if crlf:
+                    game = game.replace("\r\n", "\n")
+                if game:
+                    yield game
+
+
+def map_pgn_file(path):
+    """
+    Memory-maps a PGN file read-only for the bytes parsing path (iter_pgn_buffer),
+    returning b"" for an empty file. The mapping is not closed here: games parsed
+    from it keep referencing it for their movetext, and it is unmapped once the
+    last of them is gone.
+    """
+    with open(path, "rb") as pgn_file:
+        if os.fstat(pgn_file.fileno()).st_size == 0:
+            return b""
+        buffer = mmap.mmap(pgn_file.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(buffer, "madvise"):
+        buffer.madvise(mmap.MADV_SEQUENTIAL)
+    return buffer
+
+
+class IngestProgress:
+    """
+    Keeps count of how far a file ingest has got: bytes read from the file on disk
+    (compressed bytes for compressed files), bytes after decompression and games
+    produced. If a callback is given it is called with the IngestProgress at most
+    once every interval seconds, plus once at the end.
+    """
+
+    def __init__(self, callback=None, interval: float = 5.0) -> None:
+        self.callback = callback
+        self.interval = interval
+        self.bytes_read = 0
+        self.bytes_decompressed = 0
+        self.games = 0
+        self.started = time.monotonic()
+        self._reported = self.started
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes_read / max(self.elapsed, 1e-9)
+
+    @property
+    def games_per_second(self) -> float:
+        return self.games / max(self.elapsed, 1e-9)
+
+    def update(self, bytes_read: int, bytes_decompressed: int, games: int) -> None:
+        self.bytes_read = bytes_read
+        self.bytes_decompressed += bytes_decompressed
+        self.games += games
+        if self.callback is not None:
+            now = time.monotonic()
+            if now - self._reported >= self.interval:
+                self._reported = now
+                self.callback(self)
+
+    def finish(self) -> None:
+        if self.callback is not None:
+            self.callback(self)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.games} games, {self.bytes_read / 1e6:.1f} MB read "
+            f"({self.bytes_per_second / 1e6:.1f} MB/s, "
+            f"{self.games_per_second:.0f} games/s)"
+        )
+
+
+def _open_decompressed(raw_file, path: Path):
+    # Picks the decompressor from the file suffix. zstandard is only needed, and
+    # only imported, for .zst files.
+    suffix = path.suffix.lower()
+    if suffix == ".zst":
+        if zstandard is None:
+            raise ImportError("reading .zst files requires the zstandard package")
+        # Lichess dumps are written with a long matching window, which the decoder
+        # has to be allowed to use
+        decompressor = zstandard.ZstdDecompressor(max_window_size=2**31)
+        return decompressor.stream_reader(raw_file, read_across_frames=True)
+    if suffix == ".gz":
+        return gzip.GzipFile(fileobj=raw_file, mode="rb")
+    if suffix == ".bz2":
+        return bz2.BZ2File(raw_file, mode="rb")
+    return raw_file
+
+
+def iter_compressed_pgn_file(
+    path, progress: IngestProgress = None, chunk_size: int = 1 << 20
+):
+    """
+    Yields each game of a PGN file compressed with zstd (.zst), gzip (.gz) or bzip2
+    (.bz2), decompressing it as a stream. Blocks of chunk_size decompressed bytes
+    go through a PGNSplitter, which finds games across block boundaries, so memory
+    stays at about one block plus one game however big the dump is. Plain .pgn
+    files are read the same way. Pass an IngestProgress to follow the throughput.
+    """
+    path = Path(path)
+    progress = progress if progress is not None else IngestProgress()
+    splitter = None
+    crlf = False
+    with open(path, "rb") as raw_file:
+        stream = _open_decompressed(raw_file, path)
+        try:
+            while chunk := stream.read(chunk_size):
+                if splitter is None:
+                    # As in iter_pgn_file, a UTF-8 BOM is dropped, the line endings
+                    # are detected from the start of the file and CRLF games are
+                    # normalised to LF
+                    if chunk[:3] == b"\xef\xbb\xbf":
+                        chunk = chunk[3:]
+                    crlf = chunk.find(b"\r\n", 0, 65536) != -1
+                    newline = b"\r\n" if crlf else b"\n"
+                    splitter = PGNSplitter(
+                        separator=newline + newline + GAME_START, keep=len(GAME_START)
+                    )
+                games = splitter.feed(chunk)
+                if crlf:
+                    games = [game.replace("\r\n", "\n") for game in games]
+                progress.update(raw_file.tell(), len(chunk), len(games))
+                yield from games
+            games = splitter.flush() if splitter is not None else []
+            if crlf:
+                games = [game.replace("\r\n", "\n") for game in games]
+            progress.update(raw_file.tell(), 0, len(games))
+            yield from games
+        finally:
+            if stream is not raw_file:
+                stream.close()
+    progress.finish()
+
+
+class TokenizedPGN:
+    """
+    The pieces of a single PGN game as produced by tokenize_pgn: the tags keyed by
+    lower-case name, the SAN tokens in order, the clock readings taken from
+    [%clk ...] comments, the text of every comment (between, but not including,
+    the braces), the result token and the number of full moves. moves is the
+    cleaned movetext ("1. e4 e5 2. Nf3 ... 1-0"), without comments or the "N..."
+    black move numbers.
+    """
+
+    __slots__ = ("tags", "sans", "clocks", "comments", "result", "nmoves", "moves")
+
+    def __init__(self, tags, sans, clocks, comments, result, nmoves, moves) -> None:
+        self.tags = tags
+        self.sans = sans
+        self.clocks = clocks
+        self.comments = comments
+        self.result = result
+        self.nmoves = nmoves
+        self.moves = moves
+
+
+def _clean_move_tokens(tokens: list) -> list:
+    # Slow path for movetext with variations, NAGs, annotations or move numbers glued
+    # to their move ("12.e4"), none of which appear in chess.com or lichess.org
+    # exports but all of which are legal PGN
+    cleaned = []
+    depth = 0
+    for token in tokens:
+        if depth or token[0] == "(":
+            depth += token.count("(") - token.count(")")
+            continue
+        if token[0] == "$":
+            continue
+        if token[0].isdigit() and "." in token:
+            dot = token.rfind(".")
+            if dot != len(token) - 1:
+                number = token[: token.find(".")]
+                cleaned.append(f"{number}..." if "..." in token else f"{number}.")
+                token = token[dot + 1 :]
+        cleaned.append(token.rstrip("!?") or token)
+    return cleaned
+
+
+def _unescape_tag_value(value: str) -> str:
+    # Values with escaped quotes or backslashes need the slower pattern, and their
+    # escapes undone once matched
+    return value.replace('\\"', '"').replace("\\\\", "\\")
+
+
+def _parse_tags(game: str, header_end: int) -> dict:
+    if game.find("\\", 0, header_end) == -1:
+        return {
+            name.lower(): value
+            for name, value in TAG_PATTERN.findall(game, 0, header_end)
+        }
+    return {
+        name.lower(): _unescape_tag_value(value)
+        for name, value in ESCAPED_TAG_PATTERN.findall(game, 0, header_end)
+        if value
+    }
+
+
+def _header_end(game: str) -> int:
+    header_end = game.find("\n\n")
+    return len(game) if header_end == -1 else header_end
+
+
+def tokenize_movetext(movetext: str, tags: dict = None) -> TokenizedPGN:
+    """
+    Tokenizes the movetext of a single game (everything after its tags) and returns
+    it as a TokenizedPGN with the given tags, or none.
+
+    Rather than running a chain of substitutions over the movetext, it is cut once
+    at every comment brace, which leaves the moves and the comments in alternating
+    slices. The move slices are broken into tokens by str.split and sorted into
+    move numbers, moves and the result in a couple of list passes. All patterns are
+    compiled once at import.
+    """
+    # Comments cannot nest, so after turning closing braces into opening ones the
+    # even slices are movetext and the odd slices are comments
+    parts = movetext.replace("}", "{").split("{")
+    comments = parts[1::2]
+    # Exports put each clock reading in a comment of its own, which can be sliced
+    # directly; anything else falls back to searching the comments for them
+    clocks = [comment[6:-1] for comment in comments if comment[:6] == "[%clk "]
+    if len(clocks) != movetext.count("[%clk"):
+        clocks = CLOCK_PATTERN.findall(movetext)
+    movetext = " ".join(parts[0::2])
+    tokens = movetext.split()
+    if "(" in movetext or "$" in movetext or "!" in movetext or "?" in movetext:
+        tokens = _clean_move_tokens(tokens)
+    elif GLUED_MOVE_NUMBER_PATTERN.search(movetext) is not None:
+        tokens = _clean_move_tokens(tokens)
+
+    result = None
+    if tokens and tokens[-1] in RESULT_TOKENS:
+        result = tokens[-1]
+        del tokens[-1]
+
+    # Black move numbers ("12...") only reappear after a comment, so they are
+    # dropped to make the movetext from both sites look the same
+    moves = [token for token in tokens if "..." not in token]
+    sans = [token for token in moves if token[-1] != "."]
+    nmoves = len(moves) - len(sans)
+    if sans and "..." in tokens[0]:
+        # A game set up with black to move starts on a black move number
+        nmoves += 1
+    if result is not None:
+        moves.append(result)
+    return TokenizedPGN(
+        tags if tags is not None else {},
+        sans,
+        clocks,
+        comments,
+        result,
+        nmoves,
+        " ".join(moves),
+    )
+
+
+def tokenize_pgn(game: str) -> TokenizedPGN:
+    """
+    Reads a single PGN game and returns its tags, SAN tokens, clock comments and
+    move count together. See tokenize_movetext for how the movetext is read.
+    """
+    header_end = _header_end(game)
+    return tokenize_movetext(game[header_end:], _parse_tags(game, header_end))
+
+
+def parse_clocks(clocks) -> array:
+    """
+    Converts clock readings as written in [%clk ...] comments ("H:MM:SS" or
+    "H:MM:SS.f") into an array('I') of centiseconds, one per ply.
+    """
+    centiseconds = array("I")
+    for clock in clocks:
+        hours, minutes, seconds = clock.split(":")
+        centiseconds.append(
+            round((int(hours) * 3600 + int(minutes) * 60 + float(seconds)) * 100)
+        )
+    return centiseconds
+
+
+def parse_time_control(timecontrol: str) -> tuple:
+    """
+    Returns the (initial time, increment) of a time control such as "180+2" or
+    "600", both in centiseconds. Daily and unknown time controls ("1/86400", "-")
+    give (None, 0).
+    """
+    base, _, increment = timecontrol.partition("+")
+    if not base.isdigit():
+        return None, 0
+    return int(base) * 100, int(increment) * 100 if increment.isdigit() else 0
+
+
+def time_spent(clocks, initial: int = None, increment: int = 0) -> array:
+    """
+    Returns the time spent on each ply, in centiseconds, from the clock reading
+    after each ply (as returned by parse_clocks). The clocks of both players
+    alternate, so the time spent on a ply is the same player's previous reading
+    minus the current one, plus the increment, computed for the whole game in one
+    map over the array. The first move of each player is measured from initial,
+    or counted as 0, increment and all, when it is not known.
+    """
+    if initial is None:
+        spent = array("i", repeat(0, len(clocks[:2])))
+    else:
+        spent = array("i", [initial + increment - clock for clock in clocks[:2]])
+    later = map(operator.sub, clocks, clocks[2:])
+    spent.extend(map(increment.__add__, later) if increment else later)
+    return spent
+
+
+class Movetext:
+    """
+    A lazy reference to the movetext of one game: the buffer holding the game (a
+    str, bytes, a memoryview or an mmap) and the start and end offsets of its
+    movetext. Nothing is decoded or tokenized until one of the move attributes
+    (moves, nmoves, sans, clocks, comments, result) is first read, and the
+    TokenizedPGN made then is cached, so ingests that only read the tags never pay
+    for the moves.
+
+    The clock readings are also available as an array('I') of centiseconds per
+    ply in clock_array, which is read straight from the [%clk ...] comments without
+    tokenizing the moves, unless it was passed in as clocks.
+
+    str() gives the cleaned movetext. Pickling sends only the referenced slice,
+    not the whole buffer.
+    """
+
+    __slots__ = ("buffer", "start", "end", "_tokens", "_clocks")
+
+    def __init__(
+        self, buffer, start: int = 0, end: int = None, clocks: array = None
+    ) -> None:
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+        self._tokens = None
+        self._clocks = clocks
+
+    @property
+    def text(self) -> str:
+        """
+        The raw movetext, comments included.
+        """
+        text = self.buffer[self.start : self.end]
+        return text if isinstance(text, str) else str(text, "utf-8")
+
+    def _tokenize(self) -> TokenizedPGN:
+        return tokenize_movetext(self.text)
+
+    @property
+    def tokens(self) -> TokenizedPGN:
+        if self._tokens is None:
+            self._tokens = self._tokenize()
+        return self._tokens
+
+    @property
+    def moves(self) -> str:
+        return self.tokens.moves
+
+    @property
+    def nmoves(self) -> int:
+        return self.tokens.nmoves
+
+    @property
+    def sans(self) -> list:
+        return self.tokens.sans
+
+    @property
+    def clocks(self) -> list:
+        return self.tokens.clocks
+
+    @property
+    def comments(self) -> list:
+        return self.tokens.comments
+
+    @property
+    def result(self) -> str:
+        return self.tokens.result
+
+    @property
+    def clock_array(self) -> array:
+        if self._clocks is None:
+            if self._tokens is not None:
+                self._clocks = parse_clocks(self._tokens.clocks)
+            else:
+                self._clocks = parse_clocks(CLOCK_PATTERN.findall(self.text))
+        return self._clocks
+
+    @property
+    def last_comment(self) -> str:
+        """
+        The text of the last comment, found without tokenizing, or None.
+        """
+        text = self.text
+        close = text.rfind("}")
+        if close == -1:
+            return None
+        return text[text.rfind("{", 0, close) + 1 : close]
+
+    def __str__(self) -> str:
+        return self.moves
+
+    def __repr__(self) -> str:
+        if self._tokens is None:
+            return f"{type(self).__name__}(<{self.start}:{self.end}, not tokenized>)"
+        return f"{type(self).__name__}({self.moves!r})"
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Movetext):
+            return self.moves == other.moves
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self.moves)
+
+    def __reduce__(self):
+        return type(self), (self.text, 0, None, self._clocks)
+
+
+class SANMovetext(Movetext):
+    """
+    A Movetext over bare space-separated SANs followed by the result token, as in
+    the moves field of the lichess.org export. The move numbers are put back in
+    when it is tokenized so the movetext looks like the one tokenize_pgn produces.
+    There are no clock comments, so the clocks have to be passed in.
+    """
+
+    __slots__ = ()
+
+    def _tokenize(self) -> TokenizedPGN:
+        sans = self.text.split()
+        result = sans.pop() if sans and sans[-1] in RESULT_TOKENS else None
+        moves = []
+        for number, index in enumerate(range(0, len(sans), 2), 1):
+            moves.append(f"{number}.")
+            moves.extend(sans[index : index + 2])
+        if result is not None:
+            moves.append(result)
+        return TokenizedPGN(
+            {}, sans, [], [], result, (len(sans) + 1) // 2, " ".join(moves)
+        )
+
+
+def _tags_movetext(tags: dict) -> Movetext:
+    # The moves tag of a tag dict is either a lazy Movetext or, for the dicts that
+    # are not headed for GameRecords, the already cleaned movetext string, whose
+    # clock readings were kept apart under "clocks"
+    moves = tags["moves"]
+    if isinstance(moves, Movetext):
+        return moves
+    clocks = tags.get("clocks")
+    return Movetext(moves, clocks=None if clocks is None else array("I", clocks))
+
+
+def parse_pgn_header(game: str) -> tuple:
+    """
+    Reads only the tags of a single PGN game and returns them together with a lazy
+    Movetext over the rest of the game. The Movetext holds its own copy of the
+    movetext, so the game string itself is not kept alive.
+    """
+    header_end = _header_end(game)
+    return _parse_tags(game, header_end), Movetext(game[header_end:])
+
+
+# Raw tag names seen by parse_pgn_header_bytes, mapped per set of fields to the
+# lower-case key they are stored under, or to "" when they are not kept
+_TAG_KEYS = {}
+
+
+def parse_pgn_header_bytes(
+    buffer, start: int = 0, end: int = None, fields: frozenset = None
+) -> tuple:
+    """
+    Bytes counterpart of parse_pgn_header for a game held undecoded in
+    buffer[start:end], where buffer is bytes, a memoryview or an mmap. The tags
+    are matched on the raw bytes and only the values of the tags named in fields
+    (lower-case bytes, e.g. b"whiteelo") are decoded, or all of them when fields
+    is None. The movetext is not copied: the Movetext returned points back into
+    the buffer and decodes its slice on first access.
+    """
+    end = len(buffer) if end is None else end
+    find = _buffer_find(buffer)
+    header_end = find(b"\n\n", start, end)
+    if header_end == -1:
+        header_end = find(b"\n\r\n", start, end)
+        header_end = end if header_end == -1 else header_end
+    escaped = find(b"\\", start, header_end) != -1
+
+    keys = _TAG_KEYS.get(fields)
+    if keys is None:
+        keys = _TAG_KEYS.setdefault(fields, {})
+    tags = {}
+    pattern = BYTES_ESCAPED_TAG_PATTERN if escaped else BYTES_TAG_PATTERN
+    for name, value in pattern.findall(buffer, start, header_end):
+        key = keys.get(name)
+        if key is None:
+            lower = name.lower()
+            keep = fields is None or lower in fields
+            key = keys[name] = lower.decode("ascii") if keep else ""
+        if key and value:
+            tags[key] = value.decode("utf-8")
+    if escaped:
+        for key, value in tags.items():
+            tags[key] = _unescape_tag_value(value)
+    return tags, Movetext(buffer, header_end, end)
+
+
+def iter_pgn_buffer(buffer, fields: frozenset = None):
+    """
+    Yields the (tags, Movetext) of every game in a buffer holding a multi-game PGN
+    file or archive (bytes from the network, a memoryview, or an mmap from
+    map_pgn_file), parsed with parse_pgn_header_bytes. Nothing is decoded apart
+    from the values of the tags in fields, and no game is copied out of the
+    buffer, so the buffer has to stay alive as long as the movetexts are used.
+    """
+    start = 3 if buffer[:3] == b"\xef\xbb\xbf" else 0
+    crlf = b"\r\n" in bytes(buffer[start : start + 65536])
+    for game_start, game_end in iter_pgn_slices(buffer, start, crlf=crlf):
+        # Every game but the first starts with its [Event tag; a slice that does
+        # not is skipped if it is only the whitespace left at the end of a file
+        if buffer[game_start : game_start + 1] == b"[" or (
+            BYTES_NON_SPACE_PATTERN.search(buffer, game_start, game_end) is not None
+        ):
+            yield parse_pgn_header_bytes(buffer, game_start, game_end, fields)
+
+
+class LocalTimeConverter:
+    """
+    Converts the UTC date and time written in PGN tags ("YYYY.MM.DD", "HH:MM:SS")
+    into local date and time strings ("YYYY/MM/DD", "HH:MM:SS") in a configurable
+    zone, which defaults to the machine's local zone.
+
+    The fixed-width fields are sliced rather than parsed with strptime, and the
+    zone's UTC offset is looked up once per (date, hour) and cached. An hour in
+    which the offset changes part-way through (a DST transition that does not fall
+    on the hour) is never cached, so conversions around transitions stay exact.
+    """
+
+    def __init__(self, zone=None) -> None:
+        self.zone = zone if zone is not None else tz.tzlocal()
+        self._offsets = {}
+
+    def _offset(self, date_tag: str, hour: int) -> int:
+        key = (date_tag, hour)
+        offset = self._offsets.get(key)
+        if offset is None:
+            start = datetime(
+                int(date_tag[0:4]),
+                int(date_tag[5:7]),
+                int(date_tag[8:10]),
+                hour,
+                tzinfo=timezone.utc,
+            )
+            offset = int(start.astimezone(self.zone).utcoffset().total_seconds())
+            end = start + timedelta(minutes=59, seconds=59)
+            if int(end.astimezone(self.zone).utcoffset().total_seconds()) != offset:
+                return None
+            self._offsets[key] = offset
+        return offset
+
+    def _convert_exact(self, date_tag: str, time_tag: str) -> tuple:
+        utc = _parse_pgn_datetime(date_tag, time_tag)
+        local = utc.astimezone(self.zone)
+        return f"{local:%Y/%m/%d}", f"{local:%H:%M:%S}"
+
+    def convert(self, date_tag: str, time_tag: str) -> tuple:
+        """
+        Returns the tuple of (local date, local time) strings for a UTC date and time.
+        """
+        hour = int(time_tag[0:2])
+        offset = self._offset(date_tag, hour)
+        if offset is None:
+            return self._convert_exact(date_tag, time_tag)
+        seconds = hour * 3600 + int(time_tag[3:5]) * 60 + int(time_tag[6:8]) + offset
+        if 0 <= seconds < 86400:
+            local_date = date_tag.replace(".", "/")
+        else:
+            days, seconds = divmod(seconds, 86400)
+            day = date(
+                int(date_tag[0:4]), int(date_tag[5:7]), int(date_tag[8:10])
+            ) + timedelta(days=days)
+            local_date = f"{day:%Y/%m/%d}"
+        hours, seconds = divmod(seconds, 3600)
+        minutes, seconds = divmod(seconds, 60)
+        return local_date, f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+    def convert_many(self, date_tags, time_tags) -> tuple:
+        """
+        Batch version of convert for whole columns. Takes two parallel sequences of
+        UTC dates and times and returns two lists of local dates and local times.
+        """
+        converted = list(map(self.convert, date_tags, time_tags))
+        return [pair[0] for pair in converted], [pair[1] for pair in converted]
+
+
+_default_converter = None
+_default_converter_lock = Lock()
+
+
+def get_default_converter() -> LocalTimeConverter:
+    """
+    Returns the module-wide LocalTimeConverter for the machine's local zone, which
+    parsers share when they are not given a zone so that they share its cache.
+    """
+    global _default_converter
+    with _default_converter_lock:
+        if _default_converter is None:
+            _default_converter = LocalTimeConverter()
+        return _default_converter
+
+
+class InternTable:
+    """
+    Keeps one canonical copy of every distinct value it is given, so that
+    categorical tag values repeated across thousands of games (events, sites, time
+    controls, terminations, ECO codes, player names...) are stored once and each
+    game only holds a reference to it. Unlike sys.intern the table is not
+    process-wide: each parser has its own unless one is passed in to share, so it
+    lives as long as the run or store that owns it, and clear() lets go of
+    everything at once.
+    """
+
+    def __init__(self) -> None:
+        self._values = {}
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def intern(self, value):
+        """
+        Returns the canonical copy of value, which becomes value itself the first
+        time it is seen.
+        """
+        return self._values.setdefault(value, value)
+
+    def intern_tags(self, tags: dict, fields) -> dict:
+        """
+        Replaces the values of the given fields of a tag dict, in place, by their
+        canonical copies and returns the dict. Missing fields are skipped.
+        """
+        values = self._values
+        for field in fields:
+            value = tags.get(field)
+            if value is not None:
+                tags[field] = values.setdefault(value, value)
+        return tags
+
+    def clear(self) -> None:
+        self._values.clear()
+
+
+class Result(Enum):
+    WIN = "win"
+    LOSS = "loss"
+    DRAW = "draw"
+
+
+class Ending(Enum):
+    CHECKMATE = "checkmate"
+    RESIGNATION = "resignation"
+    TIME = "time"
+    DRAW = "draw"
+    STALEMATE = "stalemate"
+    ABANDONED = "abandoned"
+
+
+class TimeCategory(Enum):
+    BULLET = "bullet"
+    BLITZ = "blitz"
+    RAPID = "rapid"
+    DAILY = "daily"
+
+
+def _to_int(value):
+    # Ratings and rating differences arrive as strings such as "1500" or "+6", or
+    # as "?" for players without a rating
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_pgn_datetime(date_tag: str, time_tag: str) -> datetime:
+    # PGN dates and times are fixed width ("YYYY.MM.DD" and "HH:MM:SS"), so they
+    # are sliced rather than run through strptime
+    return datetime(
+        int(date_tag[0:4]),
+        int(date_tag[5:7]),
+        int(date_tag[8:10]),
+        int(time_tag[0:2]),
+        int(time_tag[3:5]),
+        int(time_tag[6:8]),
+        tzinfo=timezone.utc,
+    )
+
+
+def _parse_local_datetime(date_tag: str, time_tag: str) -> datetime:
+    # The local date and time tags ("YYYY/MM/DD", "HH:MM:SS") are fixed width too
+    return datetime(
+        int(date_tag[0:4]),
+        int(date_tag[5:7]),
+        int(date_tag[8:10]),
+        int(time_tag[0:2]),
+        int(time_tag[3:5]),
+        int(time_tag[6:8]),
+    )
+
+
+@dataclass(frozen=True, slots=True)
+class GameRecord:
+    """
+    A compact, immutable record of one parsed game, produced by both parsers as a
+    lighter alternative to their tag dicts. Ratings and the rating difference are
+    ints, the result, ending and time category are enums, increment is a bool
+    (None for daily games), start is the UTC start time and local_start the naive
+    local wall-clock time the localdate/localtime tags are made from. The UTC end
+    time and the accuracies are only known for games read from the chess.com JSON
+    archives.
+
+    The moves are kept as a lazy Movetext and only tokenized the first time moves
+    or nmoves is read.
+    """
+
+    site: str
+    game_id: str
+    event: str
+    white: str
+    black: str
+    whiteelo: int
+    blackelo: int
+    result: Result
+    ending: Ending
+    elodiff: int
+    timecontrol: str
+    timecategory: TimeCategory
+    increment: bool
+    termination: str
+    eco: str
+    start: datetime
+    local_start: datetime
+    movetext: Movetext
+    end: datetime = None
+    white_accuracy: float = None
+    black_accuracy: float = None
+
+    @classmethod
+    def from_tags(cls, tags: dict):
+        """
+        Builds a record from the enriched tag dict of either parser.
+        """
+        ending = tags.get("ending")
+        return cls(
+            site=tags.get("site"),
+            game_id=tags["game_id"],
+            event=tags.get("event"),
+            white=tags["white"],
+            black=tags["black"],
+            whiteelo=_to_int(tags.get("whiteelo")),
+            blackelo=_to_int(tags.get("blackelo")),
+            result=Result(tags["result"]),
+            ending=Ending(ending) if ending else None,
+            elodiff=_to_int(tags.get("elodiff")),
+            timecontrol=tags["timecontrol"],
+            timecategory=TimeCategory(tags["timecategory"]),
+            increment={"yes": True, "no": False}.get(tags.get("increment")),
+            termination=tags.get("termination"),
+            eco=tags.get("eco"),
+            start=_parse_pgn_datetime(tags["utcdate"], tags["utctime"]),
+            local_start=_parse_local_datetime(tags["localdate"], tags["localtime"]),
+            movetext=_tags_movetext(tags),
+        )
+
+    @property
+    def moves(self) -> str:
+        return self.movetext.moves
+
+    @property
+    def nmoves(self) -> int:
+        return self.movetext.nmoves
+
+    @property
+    def clocks(self) -> array:
+        """
+        The clock reading after each ply, in centiseconds.
+        """
+        return self.movetext.clock_array
+
+    def time_spent(self) -> array:
+        """
+        The time spent on each ply, in centiseconds. See time_spent.
+        """
+        return time_spent(self.clocks, *parse_time_control(self.timecontrol))
+
+    @property
+    def localdate(self) -> str:
+        return f"{self.local_start:%Y/%m/%d}"
+
+    @property
+    def localtime(self) -> str:
+        return f"{self.local_start:%H:%M:%S}"
+
+    def to_dict(self) -> dict:
+        """
+        Returns the fields of the record as a dict of JSON-ready values: enums by
+        their value, datetimes in ISO format and the movetext as its cleaned moves.
+        """
+        values = {}
+        for field in dataclass_fields(self):
+            value = getattr(self, field.name)
+            if isinstance(value, Enum):
+                value = value.value
+            elif isinstance(value, datetime):
+                value = value.isoformat()
+            elif isinstance(value, Movetext):
+                value = str(value)
+            values[field.name] = value
+        return values
+
+
+def iter_records(tags):
+    """
+    Generator stage that turns enriched tag dicts into GameRecords.
+    """
+    for game in tags:
+        yield GameRecord.from_tags(game)
+
+
+class GameColumns:
+    """
+    Columnar storage for parsed games: a typed array per numeric field and, per
+    categorical field, integer codes into a list of its distinct values, so scans
+    run over compact arrays instead of per-game objects. Games are appended from
+    tag dicts (append_tags works as a pipeline sink) or GameRecords, and missing
+    numbers are stored as MISSING. count_moves=False leaves nmoves MISSING so no
+    movetext is tokenized; store_clocks=True also keeps every game's clock readings
+    back to back in clocks, delimited by clock_offsets.
+    """
+
+    MISSING = -(2**31)
+    INT_FIELDS = ("whiteelo", "blackelo", "elodiff", "nmoves")
+    # Stored as epoch seconds, the naive local start as if it were UTC
+    TIME_FIELDS = ("start", "local_start")
+    CATEGORICAL_FIELDS = (
+        "site",
+        "event",
+        "white",
+        "black",
+        "result",
+        "ending",
+        "timecontrol",
+        "timecategory",
+        "increment",
+        "termination",
+        "eco",
+    )
+    COMPARISONS = {
+        "==": operator.eq,
+        "!=": operator.ne,
+        "<": operator.lt,
+        "<=": operator.le,
+        ">": operator.gt,
+        ">=": operator.ge,
+    }
+
+    def __init__(self, count_moves: bool = True, store_clocks: bool = False) -> None:
+        self.count_moves = count_moves
+        self.store_clocks = store_clocks
+        self.clocks = array("I")
+        self.clock_offsets = array("Q", [0])
+        self.game_ids = []
+        self.ints = {field: array("i") for field in self.INT_FIELDS}
+        self.times = {field: array("q") for field in self.TIME_FIELDS}
+        self.codes = {field: array("I") for field in self.CATEGORICAL_FIELDS}
+        self.categories = {field: [] for field in self.CATEGORICAL_FIELDS}
+        self._category_codes = {field: {} for field in self.CATEGORICAL_FIELDS}
+
+    def __len__(self) -> int:
+        return len(self.game_ids)
+
+    def _encode(self, field: str, value) -> int:
+        lookup = self._category_codes[field]
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(self.categories[field])
+            self.categories[field].append(value)
+        return code
+
+    def _append(self, game_id, ints, start, local_start, categories, movetext) -> None:
+        self.game_ids.append(game_id)
+        if self.store_clocks:
+            self.clocks.extend(movetext.clock_array)
+        self.clock_offsets.append(len(self.clocks))
+        for field, value in zip(self.INT_FIELDS, ints):
+            self.ints[field].append(self.MISSING if value is None else value)
+        self.times["start"].append(int(start.timestamp()))
+        self.times["local_start"].append(
+            int(local_start.replace(tzinfo=timezone.utc).timestamp())
+        )
+        for field, value in zip(self.CATEGORICAL_FIELDS, categories):
+            self.codes[field].append(self._encode(field, value))
+
+    def append_tags(self, tags: dict) -> None:
+        """
+        Appends one game from the enriched tag dict of either parser.
+        """
+        movetext = _tags_movetext(tags)
+        if not self.count_moves:
+            nmoves = None
+        elif "nmoves" in tags:
+            nmoves = tags["nmoves"]
+        else:
+            nmoves = movetext.nmoves
+        self._append(
+            tags["game_id"],
+            (
+                _to_int(tags.get("whiteelo")),
+                _to_int(tags.get("blackelo")),
+                _to_int(tags.get("elodiff")),
+                nmoves,
+            ),
+            _parse_pgn_datetime(tags["utcdate"], tags["utctime"]),
+            _parse_local_datetime(tags["localdate"], tags["localtime"]),
+            [tags.get(field) for field in self.CATEGORICAL_FIELDS],
+            movetext,
+        )
+
+    def append_record(self, record: GameRecord) -> None:
+        """
+        Appends one game from a GameRecord. Enum fields are stored by their value
+        and increment as "yes", "no" or "n/a", the same as in the tag dicts.
+        """
+        categories = []
+        for field in self.CATEGORICAL_FIELDS:
+            value = getattr(record, field)
+            if isinstance(value, Enum):
+                value = value.value
+            elif field == "increment":
+                value = {True: "yes", False: "no", None: "n/a"}[value]
+            categories.append(value)
+        self._append(
+            record.game_id,
+            (
+                record.whiteelo,
+                record.blackelo,
+                record.elodiff,
+                record.nmoves if self.count_moves else None,
+            ),
+            record.start,
+            record.local_start,
+            categories,
+            record.movetext,
+        )
+
+    def column(self, field: str):
+        """
+        Returns a whole column: the array itself for numeric and time fields, and the
+        decoded list of strings for categorical ones.
+        """
+        if field in self.ints:
+            return self.ints[field]
+        if field in self.times:
+            return self.times[field]
+        if field == "game_id":
+            return self.game_ids
+        categories = self.categories[field]
+        return [categories[code] for code in self.codes[field]]
+
+    def where(self, field: str, op: str, value, indices=None) -> array:
+        """
+        Returns the indices of the games whose field compares true against value,
+        e.g. where("elodiff", ">", 100) or where("result", "==", "win"). Pass the
+        output of a previous call as indices to combine filters. Categorical fields
+        support only == and !=, which are evaluated on the integer codes.
+        """
+        compare = self.COMPARISONS[op]
+        if field in self.codes:
+            if op not in ("==", "!="):
+                raise ValueError(f"{op} is not supported on categorical field {field}")
+            column = self.codes[field]
+            value = self._category_codes[field].get(value, -1)
+        elif field in self.ints:
+            column = self.ints[field]
+        else:
+            column = self.times[field]
+        if indices is None:
+            indices = range(len(column))
+            values = column
+        else:
+            values = map(column.__getitem__, indices)
+        matches = map(compare, values, repeat(value))
+        if field in self.ints:
+            # Missing values never match a numeric filter
+            matches = map(
+                operator.and_,
+                matches,
+                map(
+                    operator.ne, map(column.__getitem__, indices), repeat(self.MISSING)
+                ),
+            )
+        return array("I", compress(indices, matches))
+
+    def count_by(self, field: str, indices=None) -> Counter:
+        """
+        Counts the games per value of a categorical field, optionally restricted to
+        a set of indices returned by where.
+        """
+        codes = self.codes[field]
+        if indices is not None:
+            codes = map(codes.__getitem__, indices)
+        categories = self.categories[field]
+        return Counter(
+            {categories[code]: count for code, count in Counter(codes).items()}
+        )
+
+    def _present(self, field: str, indices=None) -> list:
+        column = self.ints[field]
+        if indices is not None:
+            column = list(map(column.__getitem__, indices))
+        return list(compress(column, map(operator.ne, column, repeat(self.MISSING))))
+
+    def sum(self, field: str, indices=None) -> int:
+        """
+        Sums a numeric field, skipping missing values.
+        """
+        return sum(self._present(field, indices))
+
+    def mean(self, field: str, indices=None):
+        """
+        Averages a numeric field, skipping missing values. Returns None if there are
+        no values.
+        """
+        values = self._present(field, indices)
+        return sum(values) / len(values) if values else None
+
+    def game_clocks(self, index: int) -> array:
+        """
+        Returns the clock readings of one game, in centiseconds per ply.
+        """
+        return self.clocks[self.clock_offsets[index] : self.clock_offsets[index + 1]]
+
+    def time_spent(self) -> array:
+        """
+        Returns the time spent on every ply of every game, in centiseconds, aligned
+        with clocks. The differences are taken over the whole clocks array in one
+        map, and only the first move of each player and the increments are then
+        fixed up game by game. See time_spent for the single-game version.
+        """
+        clocks = self.clocks
+        spent = array("i", repeat(0, min(2, len(clocks))))
+        spent.extend(map(operator.sub, clocks, clocks[2:]))
+        controls = list(map(parse_time_control, self.categories["timecontrol"]))
+        offsets = self.clock_offsets
+        for code, start, end in zip(
+            self.codes["timecontrol"], offsets, islice(offsets, 1, None)
+        ):
+            initial, increment = controls[code]
+            for ply in range(start, min(start + 2, end)):
+                spent[ply] = 0 if initial is None else initial + increment - clocks[ply]
+            if increment and start + 2 < end:
+                spent[start + 2 : end] = array(
+                    "i", map(increment.__add__, spent[start + 2 : end])
+                )
+        return spent
+
+    def low_clock_plies(self, threshold: int, side: str = None, indices=None):
+        """
+        Counts, for each game, the plies played with less than threshold
+        centiseconds left on the clock, counting only white's or black's plies
+        when side is "white" or "black", as a measure of time trouble (e.g.
+        low_clock_plies(1000) for moves made with under ten seconds left). Returns
+        an array('I') aligned with the games, or with indices when given.
+        """
+        # One pass over the whole clocks array marks the low readings, and each
+        # game's marks are then counted by bytes.count in C
+        flags = bytes(map(threshold.__gt__, self.clocks))
+        offsets = self.clock_offsets
+        starts = offsets[:-1]
+        ends = offsets[1:]
+        if side is not None:
+            first = {"white": 0, "black": 1}[side]
+            counts = array(
+                "I",
+                (
+                    flags[start + first : end : 2].count(1)
+                    for start, end in zip(starts, ends)
+                ),
+            )
+        else:
+            counts = array("I", map(flags.count, repeat(1), starts, ends))
+        if indices is not None:
+            counts = array("I", map(counts.__getitem__, indices))
+        return counts
+
+    def to_numpy(self, field: str):
+        """
+        Returns a numeric or code column as a numpy array sharing the same memory.
+        Requires numpy, which is otherwise not needed.
+        """
+        if numpy is None:
+            raise ImportError("to_numpy requires the numpy package")
+        if field in self.codes:
+            return numpy.frombuffer(self.codes[field], dtype=numpy.uint32)
+        if field in self.ints:
+            return numpy.frombuffer(self.ints[field], dtype=numpy.int32)
+        return numpy.frombuffer(self.times[field], dtype=numpy.int64)
+
+
+def _build_records(parser):
+    """
+    Converts the enriched tag dicts in parser.pgn_tags into GameRecords, stored in
+    parser.records. Used as the build_records method of both parsers.
+    """
+    parser.records.extend(iter_records(parser.pgn_tags))
+    return parser
+
+
+def _build_columns(parser, columns: GameColumns = None) -> GameColumns:
+    """
+    Fills a GameColumns (a new one by default) from the tag dicts in
+    parser.pgn_tags and returns it. To fill one without keeping the tag dicts at
+    all, pass its append_tags method as the sink of the parser's pipeline(). Used
+    as the build_columns method of both parsers.
+    """
+    columns = columns if columns is not None else GameColumns()
+    for game in parser.pgn_tags:
+        columns.append_tags(game)
+    return columns
+
+
+def run_pipeline(source, *stages, sink=None):
+    """
+    Chains generator stages onto a source iterable, each stage being a function that
+    takes an iterable and returns an iterator, so that every game passes through
+    all of the stages before the next one is read.
+
+    Without a sink the composed generator is returned for the caller to consume.
+    With one, sink is called with every record that comes out of the last stage and
+    the number of records is returned.
+    """
+    stream = source
+    for stage in stages:
+        stream = stage(stream)
+    if sink is None:
+        return stream
+    count = 0
+    for record in stream:
+        sink(record)
+        count += 1
+    return count
+
+
+def iter_chunks(items, chunksize: int):
+    """
+    Groups any iterable into lists of up to chunksize items, reading it lazily.
+    """
+    items = iter(items)
+    while chunk := list(islice(items, chunksize)):
+        yield chunk
+
+
+def parallel_map_chunks(function, chunks, workers: int = None):
+    """
+    Applies function, which must be a picklable module-level function, to every
+    chunk in a pool of worker processes and yields its results in the order of the
+    chunks. Only a window of twice as many chunks as there are workers is in flight
+    at a time, so chunks can be a stream of any length.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = iter(chunks)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque(
+            executor.submit(function, chunk) for chunk in islice(chunks, workers * 2)
+        )
+        try:
+            while pending:
+                result = pending.popleft().result()
+                for chunk in islice(chunks, 1):
+                    pending.append(executor.submit(function, chunk))
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _parse_chesscom_records_chunk(chunk: list) -> list:
+    # Runs in a worker process, like _parse_chesscom_chunk, but sends each game back
+    # as the plain tuple of GameRecord field values. The fields are read with one
+    # attrgetter rather than dataclasses.astuple, which deep-copies every value.
+    parser = ChesscomParser(chunk[0][0], zone=chunk[0][1])
+    values = operator.attrgetter(
+        *(field.name for field in dataclass_fields(GameRecord))
+    )
+    return [
+        values(
+            GameRecord.from_tags(
+                parser._supplement_tags(parser._extract_tags(game, lazy=True))
+            )
+        )
+        for game in chunk[1:]
+    ]
+
+
+def _parse_chesscom_chunk(chunk: list) -> tuple:
+    # Runs in a worker process. chunk is a (username, zone) tuple followed by raw PGN
+    # strings.
+    # Rather than a list of dicts, which would pickle every key of every game, the
+    # games are sent back as one tuple of field names for the chunk plus a tuple of
+    # values per game, with None standing in for tags a game does not have.
+    parser = ChesscomParser(chunk[0][0], zone=chunk[0][1])
+    fields = {}
+    games = []
+    for game in chunk[1:]:
+        tags = parser._supplement_tags(parser._extract_tags(game))
+        for field in tags:
+            fields.setdefault(field, len(fields))
+        games.append(tags)
+    fields = tuple(fields)
+    return fields, [tuple(tags.get(field) for field in fields) for tags in games]
+
+
+class JSONLinesSink:
+    """
+    A pipeline sink that appends every record, a tag dict or a GameRecord (written
+    as its to_dict()), to a file as one line of JSON. Use it as a context manager
+    so that the file is closed when the pipeline is done.
+    """
+
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def __call__(self, record) -> None:
+        if isinstance(record, GameRecord):
+            record = record.to_dict()
+        elif not isinstance(record, dict):
+            raise TypeError(
+                f"expected a dict or a GameRecord, not {type(record).__name__}"
+            )
+        self._file.write(json.dumps(record, default=str))
+        self._file.write("\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class WatermarkStore:
+    """
+    Persists how far the last sync got for each (source, username) pair in a small
+    JSON file, so that the next sync only has to fetch and process what is new. A
+    watermark is a plain dict whose contents are up to the parser that owns it.
+    """
+
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+        self._lock = Lock()
+        try:
+            self._watermarks = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            self._watermarks = {}
+
+    def get(self, source: str, username: str):
+        """
+        Returns the stored watermark for the user, or None if they were never synced.
+        """
+        return self._watermarks.get(f"{source}:{username}")
+
+    def set(self, source: str, username: str, watermark: dict) -> None:
+        """
+        Stores the watermark for the user and writes the whole store back to disk.
+        """
+        with self._lock:
+            self._watermarks[f"{source}:{username}"] = watermark
+            tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            tmp_path.write_text(json.dumps(self._watermarks, indent=2))
+            os.replace(tmp_path, self.path)
+
+
+class LichessUser(TypedDict, total=False):
+    name: str
+
+
+class LichessPlayer(TypedDict, total=False):
+    user: LichessUser
+    rating: int
+    ratingDiff: int
+
+
+class LichessPlayers(TypedDict, total=False):
+    white: LichessPlayer
+    black: LichessPlayer
+
+
+class LichessClock(TypedDict, total=False):
+    initial: int
+    increment: int
+
+
+class LichessGame(TypedDict, total=False):
+    # The fields of a full export game that _json_to_tags and the cursor read
+    id: str
+    createdAt: int
+    winner: str
+    lastFen: str
+    pgn: str
+
+
+class LeanLichessGame(TypedDict, total=False):
+    # The fields of a lean export game that record_from_lean_json reads
+    id: str
+    createdAt: int
+    rated: bool
+    speed: str
+    status: str
+    winner: str
+    players: LichessPlayers
+    clock: LichessClock
+    moves: str
+    clocks: list
+
+
+class JSONDecoder:
+    """
+    Decodes JSON documents (bytes or str) with the fastest backend available:
+    msgspec, then orjson, then the standard library. backend picks one by name
+    ("msgspec", "orjson" or "json") instead.
+
+    With msgspec, a TypedDict passed as type is decoded straight into dicts that
+    hold only the fields it declares, so the rest of each document is skipped
+    rather than materialized. The other backends ignore type and return the full
+    document. Malformed input raises ValueError whatever the backend.
+    """
+
+    def __init__(self, backend: str = None, type=None) -> None:
+        if backend is None:
+            if msgspec is not None:
+                backend = "msgspec"
+            elif orjson is not None:
+                backend = "orjson"
+            else:
+                backend = "json"
+        if backend == "msgspec":
+            if msgspec is None:
+                raise ImportError("the msgspec backend requires the msgspec package")
+            self._decoder = msgspec.json.Decoder(type if type is not None else object)
+        elif backend == "orjson":
+            if orjson is None:
+                raise ImportError("the orjson backend requires the orjson package")
+        elif backend != "json":
+            raise ValueError(f"unknown JSON backend: {backend}")
+        self.backend = backend
+        self.type = type
+
+    def decode(self, data):
+        if self.backend == "orjson":
+            return orjson.loads(data)
+        if self.backend == "json":
+            return json.loads(data)
+        try:
+            return self._decoder.decode(data)
+        except msgspec.MsgspecError as error:
+            raise ValueError(str(error)) from error
 
 
 class ChesscomParser:
@@ -11,11 +1989,92 @@ class ChesscomParser:
     CONTENT_TYPE = "application/x-chess-pgn"
     UTC_ZONE = tz.tzutc()
     LOCAL_ZONE = tz.tzlocal()
+    SOURCE = "chess.com"
+    END_PATTERN = re.compile(
+        r'\[EndDate "([^"]+)"\].*?\[EndTime "([^"]+)"\].*?\[Link "[^"]*?(\d+)"\]',
+        re.DOTALL,
+    )
+    # Tags whose values repeat from game to game and are kept once in the intern
+    # table. Site is interned by _supplement_tags once it is lower-cased.
+    INTERNED_TAGS = (
+        "event",
+        "date",
+        "round",
+        "white",
+        "black",
+        "timezone",
+        "eco",
+        "ecourl",
+        "utcdate",
+        "timecontrol",
+        "termination",
+        "enddate",
+        "localdate",
+    )
+    # The only tags that _supplement_tags and GameRecord read, and so the only ones
+    # the bytes path decodes by default
+    RECORD_TAGS = frozenset(
+        {
+            b"event",
+            b"site",
+            b"white",
+            b"black",
+            b"result",
+            b"whiteelo",
+            b"blackelo",
+            b"timecontrol",
+            b"termination",
+            b"eco",
+            b"utcdate",
+            b"utctime",
+            b"link",
+        }
+    )
 
-    def __init__(self, username) -> None:
+    # Game result codes used by the chess.com JSON archives, mapped to how the game
+    # ended. "win" is not listed as the winner's code says nothing about the ending.
+    JSON_ENDINGS = {
+        "checkmated": Ending.CHECKMATE,
+        "resigned": Ending.RESIGNATION,
+        "timeout": Ending.TIME,
+        "abandoned": Ending.ABANDONED,
+        "stalemate": Ending.STALEMATE,
+        "agreed": Ending.DRAW,
+        "repetition": Ending.DRAW,
+        "insufficient": Ending.DRAW,
+        "50move": Ending.DRAW,
+        "timevsinsufficient": Ending.DRAW,
+    }
+    JSON_DRAWS = frozenset(
+        {
+            "agreed",
+            "repetition",
+            "stalemate",
+            "insufficient",
+            "50move",
+            "timevsinsufficient",
+        }
+    )
+
+    def __init__(
+        self,
+        username,
+        session: HTTPSession = None,
+        zone=None,
+        interner: InternTable = None,
+    ) -> None:
         self.username = username
+        self.session = session if session is not None else get_default_session()
+        if zone is None:
+            self.converter = get_default_converter()
+        else:
+            self.converter = LocalTimeConverter(zone)
+        self.interner = interner if interner is not None else InternTable()
+        self.watermark = None
         self.pgn_list = []
         self.pgn_tags = []
+        self.records = []
+        self.archive_months = None
 
     def _create_headers(self) -> dict:
         """
@@ -32,104 +2091,222 @@ class ChesscomParser:
         """
         Takes in the UTC date and time as written in the PGN text fetched from the
         chess.com server, returns a tuple of date and time as string with the
-        formatting (YYYY/MM/DD, HH:MM:SS).
+        formatting (YYYY/MM/DD, HH:MM:SS) in the parser's zone.
+        """
+        return self.converter.convert(date, time)
+
+    def _extract_tags(self, game: str, lazy: bool = False) -> dict:
+        """
+        Extracts the tags, cleaned moves, move count and clock readings (a list of
+        centiseconds under "clocks") of a single raw PGN string.
+        With lazy=True only the tags are read and the moves tag is a Movetext that
+        is tokenized when a GameRecord first reads it, with no nmoves or clocks tag.
+        """
+        if lazy:
+            tags, tags["moves"] = parse_pgn_header(game)
+        else:
+            # The tokenizer drops the clock comments that are default in PGNs from
+            # chess.com, as well as the notation for black moves, which keeps the
+            # movetext consistent with PGNs from lichess.org
+            tokens = tokenize_pgn(game)
+            tags = tokens.tags
+            tags["moves"] = tokens.moves
+            tags["nmoves"] = tokens.nmoves
+            tags["clocks"] = parse_clocks(tokens.clocks).tolist()
+        return self.interner.intern_tags(tags, self.INTERNED_TAGS)
+
+    def iter_extract(self, games, lazy: bool = False):
+        """
+        Generator stage that turns raw PGN strings into tag dicts one game at a time.
+        See _extract_tags for lazy.
         """
-        utc = datetime.strptime(f"{date} {time}", "%Y.%m.%d %H:%M:%S")
-        utc = utc.replace(tzinfo=self.UTC_ZONE)
-        local = utc.astimezone(self.LOCAL_ZONE)
-        date, time = datetime.strftime(local, "%Y/%m/%d %H:%M:%S").split()
-        return date, time
+        for game in games:
+            yield self._extract_tags(game, lazy)
+
+    def iter_extract_bytes(
+        self, buffer, fields: frozenset = RECORD_TAGS, lazy: bool = False
+    ):
+        """
+        Bytes counterpart of iter_extract for a whole undecoded archive or dump
+        (bytes, a memoryview or an mmap, see iter_pgn_buffer). Only the tags in
+        fields are decoded, by default just the ones the supplemental tags and
+        GameRecords need; fields=None keeps them all. With lazy=True the moves tag
+        is a Movetext that references the buffer rather than a copy of the game.
+        """
+        for tags, movetext in iter_pgn_buffer(buffer, fields):
+            if lazy:
+                tags["moves"] = movetext
+            else:
+                tags["moves"] = movetext.moves
+                tags["nmoves"] = movetext.nmoves
+                tags["clocks"] = movetext.clock_array.tolist()
+            yield self.interner.intern_tags(tags, self.INTERNED_TAGS)
 
     def extract_pgn_tags(self) -> list:
         """
-        Takes in a PGN string from the fetched games and uses regex to extract the headers (tags)
-        that are associated with the game.
-        """
-        tag_pattern = re.compile(r'\[([A-Za-z]+)\s"([^"]+)"\]')
-        for game in self.pgn_list:
-            match = tag_pattern.findall(game)
-            tags = {tag[0].lower(): tag[1] for tag in match}
-            moves_start = game.find("\n\n") + 2
-            # This sort of complex line uses the above start index of the moves in the PGN
-            # string to slice out all of the moves and then uses re.sub to remove the
-            # clock notation that is default in PGNs from chess.com. It also removes the
-            # notation for black moves to make it consistent with PGNs from lichess.org
-            tags["moves"] = re.sub(r"{\S+ \S+}", "", game[moves_start:].strip())
-            tags["moves"] = re.sub(r"\s\d+\.\.\.\s", "", tags["moves"])
-            self.pgn_tags.append(tags)
+        Takes in a PGN string from the fetched games and uses tokenize_pgn to extract the
+        headers (tags) that are associated with the game, its moves and their count.
+        """
+        self.pgn_tags.extend(self.iter_extract(self.pgn_list))
         return self
 
+    def _supplement_tags(self, game: dict) -> dict:
+        """
+        Adds the supplemental tags to the tag dict of a single game, in place, and
+        returns it.
+        """
+        # Generates tags for local date and local time
+        local_date, game["localtime"] = self.convert_utc_to_local(
+            game["utcdate"], game["utctime"]
+        )
+        game["localdate"] = self.interner.intern(local_date)
+
+        # Extracts tag for game ID
+        game["game_id"] = game["link"].rpartition("/")[2]
+
+        # Determines overall result of the game, from the parser user's side as
+        # record_from_json does
+        username = self.username.lower()
+        split_termination = game["termination"].split()
+        if game["result"] == "1/2-1/2" or "drawn" in split_termination:
+            game["result"] = "draw"
+        elif split_termination[0].lower() == username:
+            game["result"] = "win"
+        else:
+            game["result"] = "loss"
+        ending = " ".join(split_termination[-2:])
+
+        # Gets reason for ending of game
+        match ending:
+            case "by checkmate":
+                game["ending"] = "checkmate"
+            case "by resignation":
+                game["ending"] = "resignation"
+            case "on time":
+                game["ending"] = "time"
+            case "by repetition" | "by agreement" | "move rule":
+                game["ending"] = "draw"
+            case "by stalemate":
+                game["ending"] = "stalemate"
+            case "insufficient material":
+                game["ending"] = "draw"
+            case "game abandoned":
+                game["ending"] = "abandoned"
+
+        # Finds the rating differential relative to me
+        if game["white"].lower() == username:
+            game["elodiff"] = int(game["whiteelo"]) - int(game["blackelo"])
+        else:
+            game["elodiff"] = int(game["blackelo"]) - int(game["whiteelo"])
+
+        # Parses time control information
+        if "/" in game["timecontrol"]:
+            game["timecategory"] = "daily"
+            game["increment"] = "n/a"
+        else:
+            time_split = int(game["timecontrol"].split("+")[0])
+            if time_split >= 600:
+                game["timecategory"] = "rapid"
+            elif 60 < time_split < 600:
+                game["timecategory"] = "blitz"
+            else:
+                game["timecategory"] = "bullet"
+        if "+" in game["timecontrol"]:
+            game["increment"] = "yes"
+        else:
+            game["increment"] = "no"
+
+        # Putting chess.com into lower case
+        game["site"] = self.interner.intern(game["site"].lower())
+
+        return game
+
+    def iter_supplemental(self, tags):
+        """
+        Generator stage that adds the supplemental tags to each tag dict it is given.
+        """
+        for game in tags:
+            yield self._supplement_tags(game)
+
     def generate_supplemental_tags(self) -> dict:
         """
         Takes the existing tags that are generated by chess.com and uses them to generate desirable
         information not found in default tags (i.e. game ID and local date/time).
         """
         for game in self.pgn_tags:
-            # Generates tags for local date and local time
-            game["localdate"], game["localtime"] = self.convert_utc_to_local(
-                game["utcdate"], game["utctime"]
-            )
-
-            # Extracts tag for game ID
-            game["game_id"] = re.search(r".+/(\d+)", game["link"])[1]
+            self._supplement_tags(game)
+        return self
 
-            # Determines overall result of the game
-            split_termination = game["termination"].split()
-            if split_termination[0] == "seanyseand":
-                game["result"] = "win"
-            elif game["result"] == "Game":
-                game["result"] = "draw"
-            else:
-                game["result"] = "loss"
-            ending = " ".join(split_termination[-2:])
-
-            # Gets reason for ending of game
-            match ending:
-                case "by checkmate":
-                    game["ending"] = "checkmate"
-                case "by resignation":
-                    game["ending"] = "resignation"
-                case "on time":
-                    game["ending"] = "time"
-                case "by repetition":
-                    game["ending"] = "draw"
-                case "by stalemate":
-                    game["ending"] = "stalemate"
-                case "insufficient material":
-                    game["ending"] = "draw"
-                case "game abandoned":
-                    game["ending"] = "abandoned"
-
-            # Finds the rating differential relative to me
-            if game["white"] == "seanyseand":
-                game["elodiff"] = int(game["whiteelo"]) - int(game["blackelo"])
-            else:
-                game["elodiff"] = int(game["blackelo"]) - int(game["whiteelo"])
+    build_records = _build_records
+    build_columns = _build_columns
 
-            # Parses time control information
-            if "/" in game["timecontrol"]:
-                game["timecategory"] = "daily"
-                game["increment"] = "n/a"
-            else:
-                time_split = int(game["timecontrol"].split("+")[0])
-                if time_split >= 600:
-                    game["timecategory"] = "rapid"
-                elif 60 < time_split < 600:
-                    game["timecategory"] = "blitz"
-                else:
-                    game["timecategory"] = "bullet"
-            if "+" in game["timecontrol"]:
-                game["increment"] = "yes"
-            else:
-                game["increment"] = "no"
+    def pipeline(self, source=None, sink=None, records=False):
+        """
+        Streams games through fetch -> split -> extract -> enrich -> sink without
+        building any intermediate list. source is any iterable of raw PGN strings,
+        for instance iter_month_range_pgns(...) or iter_month_pgns(...), and
+        defaults to the current month's games. See run_pipeline for what sink does.
+        With records=True the pipeline produces GameRecords instead of tag dicts.
+        """
+        if source is None:
+            today = datetime.today()
+            source = self.iter_month_pgns(date(today.year, today.month, 1))
+        # GameRecords read the moves lazily, so only the tags are parsed up front
+        stages = [partial(self.iter_extract, lazy=records), self.iter_supplemental]
+        if records:
+            stages.append(iter_records)
+        return run_pipeline(source, *stages, sink=sink)
 
-            # Determines number of moves in the game
-            moves_list = re.split(r"\d+\.", game["moves"])
-            game["nmoves"] = len([move for move in moves_list if move.strip()])
+    def pipeline_bytes(
+        self, buffer, sink=None, records=False, fields: frozenset = RECORD_TAGS
+    ):
+        """
+        Runs the pipeline over an undecoded buffer, such as the bytes returned by
+        fetch_month_bytes or a dump mapped with map_pgn_file, instead of over PGN
+        strings. See iter_extract_bytes for fields and pipeline for the rest.
+        """
+        stages = [self.iter_supplemental]
+        if records:
+            stages.append(iter_records)
+        return run_pipeline(
+            self.iter_extract_bytes(buffer, fields, lazy=records), *stages, sink=sink
+        )
 
-            # Putting chess.com into lower case
-            game["site"] = game["site"].lower()
+    def iter_parse_parallel(
+        self, games, workers: int = None, chunksize: int = 500, records=False
+    ):
+        """
+        Extracts and enriches raw PGN strings in a pool of worker processes, and
+        yields the resulting tag dicts in the same order as the games. games may be
+        a list or a stream; it is cut into chunks of chunksize games, and workers
+        defaults to the number of CPUs. Dicts rebuilt from the workers' compact
+        rows carry every field seen in their chunk, with None for missing tags.
+        With records=True GameRecords are yielded instead of dicts.
+        """
+        parser_args = (self.username, self.converter.zone)
+        chunks = ([parser_args] + chunk for chunk in iter_chunks(games, chunksize))
+        if records:
+            for rows in parallel_map_chunks(
+                _parse_chesscom_records_chunk, chunks, workers
+            ):
+                for row in rows:
+                    yield GameRecord(*row)
+            return
+        # Values come back from each worker as fresh copies, so they are interned
+        # again in this process
+        intern_tags = self.interner.intern_tags
+        for fields, rows in parallel_map_chunks(_parse_chesscom_chunk, chunks, workers):
+            for row in rows:
+                yield intern_tags(dict(zip(fields, row)), self.INTERNED_TAGS)
 
+    def parse_parallel(self, workers: int = None, chunksize: int = 500):
+        """
+        Parallel version of extract_pgn_tags followed by generate_supplemental_tags
+        for self.pgn_list, using iter_parse_parallel.
+        """
+        self.pgn_tags.extend(
+            self.iter_parse_parallel(self.pgn_list, workers, chunksize)
+        )
         return self
 
     def fetch_current_month_pgns(self) -> list:
@@ -138,12 +2315,8 @@ class ChesscomParser:
         games played in the month that the script is being run in. Returns a UTF-8
         encoded string.
         """
-        url = f"https://api.chess.com/pub/player/{self.username}/games/{(today:=datetime.today()):%Y}/{today:%m}/pgn"
-        headers = self._create_headers()
-        response = requests.get(url=url, headers=headers)
-        response.raise_for_status()
-        pgns = response.text
-        self.pgn_list = pgns.split("\n\n\n")
+        today = datetime.today()
+        self.pgn_list = list(self.iter_month_pgns(date(today.year, today.month, 1)))
         return self.pgn_list
 
     def fetch_specific_month_pgns(self, date: str) -> list:
@@ -151,21 +2324,14 @@ class ChesscomParser:
         Uses the requests library to fetch the raw multi-game PGN text for
         games played in the specified month. Returns a UTF-8 encoded string.
         """
-        year, month = date.split("/")
-        url = (
-            f"https://api.chess.com/pub/player/{self.username}/games/{year}/{month}/pgn"
-        )
-        headers = self._create_headers()
-        response = requests.get(url=url, headers=headers)
-        response.raise_for_status()
-        pgns = response.text
-        self.pgn_list = pgns.split("\n\n\n")
+        month = self._month_list(date, date)[0]
+        self.pgn_list = list(self.iter_month_pgns(month))
         return self.pgn_list
 
-    def fetch_month_range_pgns(self, start_in: str, end_in: str) -> list:
+    def _month_list(self, start_in: str, end_in: str) -> list:
         """
-        Uses the requests library to fetch the raw multi-game PGN text for
-        games played in the specified month. Returns a UTF-8 encoded string.
+        Expands a pair of "YYYY/MM" strings into the list of first-of-month dates
+        between them, inclusive of both ends.
         """
         month_list = []
 
@@ -176,32 +2342,442 @@ class ChesscomParser:
         while start <= end:
             month_list.append(start)
             start += relativedelta(months=1)
+        return month_list
 
-        pgn_accumulator = ""
-        for m in month_list:
-            url = f"https://api.chess.com/pub/player/{self.username}/games/{m.year}/{m.month:02d}/pgn"
-            headers = self._create_headers()
-            response = requests.get(url=url, headers=headers)
-            response.raise_for_status()
-            if response.text:
-                pgn_accumulator += response.text.rstrip()
-                pgn_accumulator += "\n\n\n"
+    def fetch_archive_months(self, refresh: bool = False) -> list:
+        """
+        Reads the player's archives index from chess.com, which lists only the
+        months in which the player has games, and returns them as a sorted list of
+        first-of-month dates. The list is kept on the instance for subsequent calls
+        (pass refresh=True to fetch it again) and, when the session has an on-disk
+        cache, revalidated with a conditional request across runs.
+        """
+        if self.archive_months is not None and not refresh:
+            return self.archive_months
+
+        url = f"https://api.chess.com/pub/player/{self.username}/games/archives"
+        headers = self._create_headers()
+        archives = json.loads(self.session.get_text(url, headers=headers))["archives"]
+        months = []
+        for archive_url in archives:
+            year, month = archive_url.rstrip("/").split("/")[-2:]
+            months.append(date(int(year), int(month), 1))
+        self.archive_months = sorted(months)
+        return self.archive_months
+
+    def _range_months(self, start_in: str, end_in: str, discover: bool) -> list:
+        """
+        Returns the months from start_in to end_in ("YYYY/MM"), keeping only those
+        listed in the player's archives index when discover is True.
+        """
+        month_list = self._month_list(start_in, end_in)
+        if discover:
+            archive_months = set(self.fetch_archive_months())
+            month_list = [m for m in month_list if m in archive_months]
+        return month_list
+
+    def _month_end(self, month: date) -> datetime:
+        """
+        Returns the UTC instant at which a month's archive stops changing, i.e. the
+        start of the following month. A copy fetched after that point is final.
+        """
+        next_month = month + relativedelta(months=1)
+        return datetime(next_month.year, next_month.month, 1, tzinfo=timezone.utc)
+
+    def _month_url(self, month: date, archive: str = "pgn") -> str:
+        """
+        Returns the URL of a month's archive, either as multi-game PGN text
+        (archive="pgn") or as structured JSON (archive="json").
+        """
+        url = f"https://api.chess.com/pub/player/{self.username}/games/{month.year}/{month.month:02d}"
+        return f"{url}/pgn" if archive == "pgn" else url
+
+    def _fetch_month_content(
+        self, month: date, limiter: HostLimiter = None, archive: str = "pgn"
+    ) -> bytes:
+        """
+        Fetches the undecoded multi-game PGN (or, with archive="json", the JSON) for
+        a single month. When a limiter is given the request waits for a free slot on
+        the host before it is sent. Archives of months that have already ended are
+        served from the session's cache, when it has one, without making a request.
+        """
+        url = self._month_url(month, archive)
+        headers = self._create_headers()
+        immutable_after = self._month_end(month)
+        if limiter is None:
+            return self.session.get_content(
+                url, headers=headers, immutable_after=immutable_after
+            )
+        with limiter(url):
+            return self.session.get_content(
+                url, headers=headers, immutable_after=immutable_after
+            )
+
+    def fetch_month_bytes(self, month: date) -> bytes:
+        """
+        Fetches a single month's PGN archive as raw bytes, without decoding it, for
+        pipeline_bytes. Goes through the session's cache.
+        """
+        return self._fetch_month_content(month)
+
+    def iter_month_pgns(self, month: date):
+        """
+        Streams a single month's PGN archive and yields each game as soon as it has
+        been received in full, so parsing can start while the rest of the month is
+        still downloading.
+        """
+        url = self._month_url(month)
+        headers = self._create_headers()
+        chunks = self.session.iter_content(
+            url, headers=headers, immutable_after=self._month_end(month)
+        )
+        yield from split_pgn_stream(chunks)
+
+    def _iter_month_contents(
+        self,
+        month_list: list,
+        workers: int = 1,
+        per_host_limit: int = None,
+        archive: str = "pgn",
+    ):
+        """
+        Yields the undecoded PGN (or JSON, see _fetch_month_content) of each month in
+        month_list, in order, using a pool of workers threads. Up to that many
+        months are downloaded ahead of the one being consumed, so at most a window
+        of months is held in memory at a time rather than the whole range.
+        """
+        limiter = HostLimiter(per_host_limit or workers)
+        months = iter(month_list)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque(
+                executor.submit(self._fetch_month_content, m, limiter, archive)
+                for m in islice(months, workers)
+            )
+            try:
+                while pending:
+                    # Futures are consumed in submission order, which is what keeps
+                    # the months in chronological order
+                    content = pending.popleft().result()
+                    for m in islice(months, 1):
+                        pending.append(
+                            executor.submit(
+                                self._fetch_month_content, m, limiter, archive
+                            )
+                        )
+                    yield content
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def iter_month_range_pgns(
+        self,
+        start_in: str,
+        end_in: str,
+        workers: int = 1,
+        per_host_limit: int = None,
+        discover: bool = False,
+    ):
+        """
+        Generator version of fetch_month_range_pgns. Yields the raw PGN string of
+        each game in the range one at a time, in chronological order, so only about
+        a month of data needs to be in memory at once.
+        """
+        month_list = self._range_months(start_in, end_in, discover)
+        # Both paths split the undecoded archive with split_pgn_stream, so each
+        # game is decoded on its own and comes out the same whatever workers is
+        if workers <= 1:
+            for m in month_list:
+                yield from self.iter_month_pgns(m)
+            return
+        for content in self._iter_month_contents(month_list, workers, per_host_limit):
+            yield from split_pgn_stream([content])
+
+    def fetch_month_range_pgns(
+        self,
+        start_in: str,
+        end_in: str,
+        workers: int = 1,
+        per_host_limit: int = None,
+        discover: bool = False,
+    ) -> list:
+        """
+        Uses the requests library to fetch the raw multi-game PGN text for
+        games played in the specified month range and splits it into a list with
+        one PGN string per game.
+
+        With workers > 1 the months are downloaded in parallel by a thread pool, with
+        at most per_host_limit requests open against the chess.com API at any time
+        (defaults to the number of workers). Games are always returned in
+        chronological order regardless of the order in which the months arrive.
+
+        With discover=True the player's archives index is read first and only the
+        months that actually contain games are requested.
+
+        If a month still fails after the session's retries, the games fetched up to
+        that point are left in self.pgn_list before the error is raised.
+        """
+        self.pgn_list = []
+        for game in self.iter_month_range_pgns(
+            start_in, end_in, workers, per_host_limit, discover
+        ):
+            self.pgn_list.append(game)
+        return self.pgn_list
+
+    def iter_month_jsons(self, month: date):
+        """
+        Yields each game of a month from the structured JSON archive, as the dict
+        chess.com serves it (with url, end_time, accuracies, white/black ratings and
+        results, pgn, ...).
+        """
+        yield from json.loads(self._fetch_month_content(month, archive="json"))["games"]
+
+    def iter_month_range_jsons(
+        self,
+        start_in: str,
+        end_in: str,
+        workers: int = 1,
+        per_host_limit: int = None,
+        discover: bool = False,
+    ):
+        """
+        JSON counterpart of iter_month_range_pgns, yielding the game dicts of every
+        month in the range in chronological order.
+        """
+        month_list = self._range_months(start_in, end_in, discover)
+        if workers <= 1:
+            for m in month_list:
+                yield from self.iter_month_jsons(m)
+            return
+        for content in self._iter_month_contents(
+            month_list, workers, per_host_limit, archive="json"
+        ):
+            yield from json.loads(content)["games"]
+
+    def record_from_json(self, game: dict) -> GameRecord:
+        """
+        Builds a GameRecord straight from a game of the JSON archive. Game ID, end
+        time, ratings, result, ending, time category and accuracies come from the
+        structured fields; only the tag header of the embedded PGN is read, for the
+        start time, ECO code, event and termination; the movetext is kept as a lazy
+        Movetext.
+        """
+        if game["white"]["username"].lower() == self.username.lower():
+            me, opponent = game["white"], game["black"]
+        else:
+            me, opponent = game["black"], game["white"]
+        if me["result"] == "win":
+            result = Result.WIN
+            ending = self.JSON_ENDINGS.get(opponent["result"])
+        else:
+            result = Result.DRAW if me["result"] in self.JSON_DRAWS else Result.LOSS
+            ending = self.JSON_ENDINGS.get(me["result"])
+
+        tags, movetext = parse_pgn_header(game["pgn"])
+        self.interner.intern_tags(tags, self.INTERNED_TAGS)
+        intern = self.interner.intern
+        local_date, local_time = self.converter.convert(
+            tags["utcdate"], tags["utctime"]
+        )
+        accuracies = game.get("accuracies", {})
+        time_control = game["time_control"]
+        return GameRecord(
+            site="chess.com",
+            game_id=game["url"].rpartition("/")[2],
+            event=tags.get("event"),
+            white=intern(game["white"]["username"]),
+            black=intern(game["black"]["username"]),
+            whiteelo=game["white"]["rating"],
+            blackelo=game["black"]["rating"],
+            result=result,
+            ending=ending,
+            elodiff=me["rating"] - opponent["rating"],
+            timecontrol=intern(time_control),
+            timecategory=TimeCategory(game["time_class"]),
+            increment=None if "/" in time_control else "+" in time_control,
+            termination=tags.get("termination"),
+            eco=tags.get("eco"),
+            start=_parse_pgn_datetime(tags["utcdate"], tags["utctime"]),
+            local_start=_parse_local_datetime(local_date, local_time),
+            movetext=movetext,
+            end=datetime.fromtimestamp(game["end_time"], tz=timezone.utc),
+            white_accuracy=accuracies.get("white"),
+            black_accuracy=accuracies.get("black"),
+        )
+
+    def iter_month_range_records(
+        self,
+        start_in: str,
+        end_in: str,
+        workers: int = 1,
+        per_host_limit: int = None,
+        discover: bool = False,
+    ):
+        """
+        Yields a GameRecord for every game in the month range, built from the JSON
+        archives with record_from_json rather than by parsing the PGN archives.
+        """
+        for game in self.iter_month_range_jsons(
+            start_in, end_in, workers, per_host_limit, discover
+        ):
+            yield self.record_from_json(game)
+
+    def _game_position(self, game: str) -> tuple:
+        """
+        Returns a sortable (end date/time, game ID) key for a raw PGN string, read
+        from its EndDate, EndTime and Link tags. Chess.com archives list games in
+        the order in which they ended.
+        """
+        end_date, end_time, game_id = self.END_PATTERN.search(game).groups()
+        return f"{end_date} {end_time}", int(game_id)
+
+    def sync(
+        self, store: WatermarkStore, workers: int = 1, commit: bool = False
+    ) -> list:
+        """
+        Fetches only the games that ended after the watermark stored for this user
+        and puts them in self.pgn_list, ready for extract_pgn_tags. The archives
+        index is read again first (a single conditional request with an HTTPCache
+        on the session), and only the months from the watermark's month onwards
+        that it lists are requested. Months in which the player did not play are
+        never fetched, so a sync with no new games costs the index plus the
+        watermark's own month.
+
+        The new watermark is kept in self.watermark and only written to the store by
+        commit_watermark, once the games have been processed, so a crash while
+        processing them means they are fetched again by the next sync rather than
+        lost. Pass commit=True to write it straight away instead.
+        """
+        watermark = store.get(self.SOURCE, self.username)
+        today = datetime.now(timezone.utc)
+        end_in = f"{today:%Y/%m}"
+        archive_months = self.fetch_archive_months(refresh=True)
+        self.pgn_list = []
+        if not archive_months:
+            self.watermark = watermark
+            return self.pgn_list
+        if watermark is None:
+            start_in = f"{archive_months[0]:%Y/%m}"
+            last_position = None
+        else:
+            start_in = watermark["month"]
+            last_position = (watermark["end"], int(watermark["game_id"]))
 
-        self.pgn_list = pgn_accumulator.rstrip("\n\n\n").split("\n\n\n")
+        for game in self.iter_month_range_pgns(
+            start_in, end_in, workers, discover=True
+        ):
+            position = self._game_position(game)
+            if last_position is None or position > last_position:
+                self.pgn_list.append(game)
+                last_position = position
 
+        if self.pgn_list:
+            end, game_id = last_position
+            self.watermark = {
+                "month": end[:7].replace(".", "/"),
+                "end": end,
+                "game_id": str(game_id),
+            }
+            if commit:
+                self.commit_watermark(store)
+        else:
+            self.watermark = watermark
         return self.pgn_list
 
+    def commit_watermark(self, store: WatermarkStore) -> None:
+        """
+        Writes the watermark reached by the last sync to the store. Call it once the
+        synced games have been processed.
+        """
+        if self.watermark is not None:
+            store.set(self.SOURCE, self.username, self.watermark)
+
 
 class LichessParser:
     USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     ACCEPT = "application/x-ndjson"
     UTC_ZONE = tz.tzutc()
     LOCAL_ZONE = tz.tzlocal()
+    SOURCE = "lichess.org"
+    COMMENT_PATTERN = re.compile(r"{([^{}]+)}")
+    # Tags whose values repeat from game to game and are kept once in the intern
+    # table. Site is left out as it holds each game's own URL.
+    INTERNED_TAGS = (
+        "event",
+        "date",
+        "round",
+        "white",
+        "black",
+        "utcdate",
+        "timecontrol",
+        "termination",
+        "eco",
+        "opening",
+        "variant",
+        "localdate",
+    )
+    # lichess.org went live in 2010, so no account has games before this
+    EPOCH = datetime(2010, 1, 1, tzinfo=timezone.utc)
+    # Export options of the full profile, whose embedded PGN is read for the tags,
+    # and of the lean one, which leaves out everything record_from_lean_json does
+    # not use (players, ratings, status, winner, clock, createdAt and moves are
+    # always sent, and the clocks are asked for)
+    FULL_QUERY = {
+        "clocks": "true",
+        "literate": "true",
+        "pgnInJson": "true",
+        "tags": "true",
+        "lastFen": "true",
+    }
+    LEAN_QUERY = {
+        "moves": "true",
+        "pgnInJson": "false",
+        "tags": "false",
+        "clocks": "true",
+        "evals": "false",
+        "opening": "false",
+        "literate": "false",
+        "lastFen": "false",
+    }
+    # Game statuses of the export mapped to how the game ended. Aborted and other
+    # unfinished games have no ending and are skipped, as in iter_pgn_tags.
+    STATUS_ENDINGS = {
+        "mate": Ending.CHECKMATE,
+        "resign": Ending.RESIGNATION,
+        "outoftime": Ending.TIME,
+        "timeout": Ending.ABANDONED,
+        "stalemate": Ending.STALEMATE,
+        "draw": Ending.DRAW,
+    }
 
-    def __init__(self, username) -> None:
+    def __init__(
+        self,
+        username,
+        session: HTTPSession = None,
+        zone=None,
+        json_backend: str = None,
+        interner: InternTable = None,
+    ) -> None:
         self.username = username
+        self.session = session if session is not None else get_default_session()
+        if zone is None:
+            self.converter = get_default_converter()
+        else:
+            self.converter = LocalTimeConverter(zone)
+        self.interner = interner if interner is not None else InternTable()
+        # See JSONDecoder for json_backend, which defaults to the fastest one
+        # installed. Games handed out by the public methods are always decoded in
+        # full; the projecting decoders are only used where the games go straight
+        # into enrichment, so what callers get does not depend on the backend.
+        self.json_decoder = JSONDecoder(json_backend)
+        self._projecting_decoders = {
+            False: JSONDecoder(json_backend, LichessGame),
+            True: JSONDecoder(json_backend, LeanLichessGame),
+        }
         self.json_list = []
         self.pgn_tags = []
+        self.records = []
+        self.cursor = None
+        self.watermark = None
 
     def _create_headers(self) -> dict:
         return {"User-Agent": self.USER_AGENT, "Accept": self.ACCEPT}
@@ -210,142 +2786,400 @@ class LichessParser:
         """
         Takes in the UTC date and time as written in the PGN text fetched from the
         chess.com server, returns a tuple of date and time as string with the
-        formatting (YYYY/MM/DD, HH:MM:SS).
+        formatting (YYYY/MM/DD, HH:MM:SS) in the parser's zone.
         """
-        utc = datetime.strptime(f"{date} {time}", "%Y.%m.%d %H:%M:%S")
-        utc = utc.replace(tzinfo=self.UTC_ZONE)
-        local = utc.astimezone(self.LOCAL_ZONE)
-        date, time = datetime.strftime(local, "%Y/%m/%d %H:%M:%S").split()
-        return date, time
+        return self.converter.convert(date, time)
 
-    def fetch_current_month_jsons(self) -> str:
+    def _to_epoch_ms(self, moment: datetime) -> int:
         """
-        Uses the requests library to fetch the raw multi-game PGN text for
-        games played in the month that the script is being run in. Returns a UTF-8
-        encoded string.
+        Converts a datetime into the UNIX epoch timestamp in milliseconds that the
+        lichess.org API expects. Naive datetimes are taken to be in UTC.
+        """
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return int(moment.timestamp() * 1000)
+
+    def _iter_window_jsons(
+        self, since: int, until: int, lean: bool = False, project: bool = False
+    ):
+        """
+        Streams the NDJSON export of the games created between the since and until
+        epoch timestamps (in milliseconds, both inclusive), yielding each game as a
+        dict as soon as its line has been received. The createdAt of every game
+        yielded is recorded in self.cursor.
+
+        With lean=True the games are requested without the embedded PGN and the
+        other extras, for record_from_lean_json. With project=True only the fields
+        that enrichment reads are kept (see LichessGame and LeanLichessGame), which
+        saves decoding the rest when msgspec is installed.
         """
-        # First we need to dynamically generate the start and end of the month
-        # start = datetime(2022, 1, 1)
-        start = datetime((today := datetime.today()).year, today.month, 1)
-        end = None
-        last = 31
-        while not end:
-            try:
-                end = datetime((today := datetime.today()).year, today.month, last)
-            except ValueError:
-                last -= 1
-        # We need to conver the start and end dates into UNIX epoch timestamps
-        # in milliseconds (Python returns in seconds by default)
-
-        start = int(start.replace(tzinfo=timezone.utc).timestamp() * 1000)
-        end = int(end.replace(tzinfo=timezone.utc).timestamp() * 1000)
         url = f"https://lichess.org/api/games/user/{self.username}"
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Accept": "application/x-ndjson",
-        }
-        query = {
-            "since": start,
-            "literate": "true",
-            "until": end,
-            "pgnInJson": "true",
-            "tags": "true",
-            "lastFen": "true",
-            "sort": "dateAsc",
-        }
-        response = requests.get(url=url, headers=headers, params=query)
-        response.raise_for_status()
-        raw_data = response.text
-        split_json_strings = raw_data.split("\n")[:-1]
-        self.json_list = [json.loads(game) for game in split_json_strings]
-        return self.json_list
+        headers = self._create_headers()
+        query = {"since": since, "until": until, "sort": "dateAsc"}
+        query.update(self.LEAN_QUERY if lean else self.FULL_QUERY)
+        if project:
+            decode = self._projecting_decoders[lean].decode
+        else:
+            decode = self.json_decoder.decode
+        with self.session.get(
+            url=url, headers=headers, params=query, stream=True
+        ) as response:
+            response.raise_for_status()
+            # Each NDJSON line is decoded as soon as it arrives rather than after
+            # the whole export has been downloaded
+            for line in response.iter_lines():
+                if line:
+                    game = decode(line)
+                    self.cursor = game["createdAt"]
+                    yield game
 
-    def extract_pgn_tags_from_json(self, json_pgn) -> list:
+    def iter_range_jsons(
+        self,
+        start: datetime,
+        end: datetime,
+        chunk: relativedelta = relativedelta(months=1),
+        cursor: int = None,
+        lean: bool = False,
+    ):
         """
-        TAKES JSON
+        Streams every game created between start and end. The window is split into
+        chunks (a month each by default) that are requested one after another, so a
+        failure only costs the chunk in progress. chunk=None requests the whole
+        window at once.
+
+        self.cursor holds the createdAt timestamp (epoch milliseconds) of the last
+        game received. Passing it back in as cursor after an interruption resumes
+        the export just after that game instead of from start. See
+        _iter_window_jsons for lean.
         """
-        tag_pattern = re.compile(r'\[([A-Za-z]+)\s"([^"]+)"\]')
-        match = tag_pattern.findall(json_pgn)
-        tags = {tag[0].lower(): tag[1] for tag in match}
-        moves_start = json_pgn.find("\n\n") + 2
-        tags["moves"] = json_pgn[moves_start:].strip()
-        return tags
+        since = self._to_epoch_ms(start)
+        until = self._to_epoch_ms(end)
+        if cursor is not None:
+            since = max(since, cursor + 1)
+        self.cursor = cursor
+        if chunk is None:
+            yield from self._iter_window_jsons(since, until, lean)
+            return
 
-    def convert_json_list_to_pgn_list(self):
-        for json in self.json_list:
-            tags = self.extract_pgn_tags_from_json(json["pgn"])
-            # Generates tags for local date and local time
-            tags["localdate"], tags["localtime"] = self.convert_utc_to_local(
-                tags["utcdate"], tags["utctime"]
+        chunk_start = datetime.fromtimestamp(since / 1000, tz=timezone.utc)
+        while since <= until:
+            chunk_until = min(self._to_epoch_ms(chunk_start + chunk) - 1, until)
+            yield from self._iter_window_jsons(since, chunk_until, lean)
+            since = chunk_until + 1
+            chunk_start += chunk
+
+    def fetch_range_jsons(
+        self,
+        start: datetime,
+        end: datetime,
+        chunk: relativedelta = relativedelta(months=1),
+        cursor: int = None,
+        lean: bool = False,
+    ) -> list:
+        """
+        Fetches every game created between start and end as a list of dicts. See
+        iter_range_jsons for the chunking, cursor and lean behaviour.
+        """
+        self.json_list = list(self.iter_range_jsons(start, end, chunk, cursor, lean))
+        return self.json_list
+
+    def sync(
+        self,
+        store: WatermarkStore,
+        chunk: relativedelta = relativedelta(years=1),
+        commit: bool = False,
+    ) -> list:
+        """
+        Fetches only the games created after the watermark stored for this user and
+        puts them in self.json_list, ready for convert_json_list_to_pgn_list. The
+        export API filters on the server side, so a sync with no new games is a
+        single request returning an empty body.
+
+        The first sync of a user walks their whole history in chunks; later ones
+        request everything past the watermark in one go.
+
+        The new watermark is kept in self.watermark and only written to the store by
+        commit_watermark, once the games have been processed. Pass commit=True to
+        write it straight away instead.
+        """
+        watermark = store.get(self.SOURCE, self.username)
+        cursor = None
+        if watermark is not None:
+            cursor = watermark["created_at"]
+            chunk = None
+        self.json_list = list(
+            self.iter_range_jsons(
+                self.EPOCH, datetime.now(timezone.utc), chunk, cursor=cursor
             )
-            tags["game_id"] = json["id"]
-            tags["currentposition"] = json["lastFen"]
-
-            tags["ending"] = self.extract_ending_from_pgn(tags["moves"])
-            tags["moves"] = re.sub(r"{[^{}]+}", "", tags["moves"])
-            tags["moves"] = re.sub(r"\d+\.", r" \g<0>", tags["moves"]).strip()
-
-            if "winner" in json:
-                match json["winner"]:
-                    case "white":
-                        if tags["white"] == "seanyseand":
-                            tags["result"] = "win"
-                        else:
-                            tags["result"] = "loss"
-                    case "black":
-                        if tags["black"] == "seanyseand":
-                            tags["result"] = "win"
-                        else:
-                            tags["result"] = "loss"
+        )
+        if self.json_list:
+            self.watermark = {
+                "created_at": self.cursor,
+                "game_id": self.json_list[-1]["id"],
+            }
+            if commit:
+                self.commit_watermark(store)
+        else:
+            self.watermark = watermark
+        return self.json_list
+
+    def commit_watermark(self, store: WatermarkStore) -> None:
+        """
+        Writes the watermark reached by the last sync to the store. Call it once the
+        synced games have been processed.
+        """
+        if self.watermark is not None:
+            store.set(self.SOURCE, self.username, self.watermark)
+
+    def iter_current_month_jsons(self, lean: bool = False):
+        """
+        Streams the NDJSON export of the games played in the month that the script
+        is being run in, yielding each game as a dict as soon as its line has been
+        received. See _iter_window_jsons for lean.
+        """
+        return self._iter_window_jsons(*self._current_month_window(), lean)
+
+    def _current_month_window(self) -> tuple:
+        # The window runs from the first instant of the current UTC month up to the
+        # last millisecond before the next one
+        today = datetime.now(timezone.utc)
+        start = datetime(today.year, today.month, 1, tzinfo=timezone.utc)
+        end = start + relativedelta(months=1)
+        return self._to_epoch_ms(start), self._to_epoch_ms(end) - 1
+
+    def fetch_current_month_jsons(self, lean: bool = False) -> list:
+        """
+        Uses the requests library to fetch the games played in the month that the
+        script is being run in from the lichess.org export API. Returns a list of
+        dicts, one per game.
+        """
+        self.json_list = list(self.iter_current_month_jsons(lean))
+        return self.json_list
+
+    def extract_pgn_tags_from_json(self, json_pgn) -> dict:
+        """
+        Extracts the tags of the PGN embedded in a game from the lichess.org export
+        into a dict, along with its movetext under "moves", cleaned of comments by
+        tokenize_pgn.
+        """
+        tokens = tokenize_pgn(json_pgn)
+        return tokens.tags | {"moves": tokens.moves}
+
+    def _json_to_tags(self, json_game, lazy: bool = False) -> dict:
+        """
+        Builds the tag dict for a single game of the lichess.org export, including
+        the supplemental tags (local date/time, result, ending, time category...).
+        The clock readings are kept under "clocks" as for ChesscomParser. With
+        lazy=True the moves tag is a Movetext that is tokenized when a GameRecord
+        first reads it, and there is no nmoves or clocks tag.
+        """
+        tags, movetext = parse_pgn_header(json_game["pgn"])
+        if lazy:
+            tags["moves"] = movetext
+        else:
+            tags["moves"] = movetext.moves
+            tags["nmoves"] = movetext.nmoves
+            tags["clocks"] = movetext.clock_array.tolist()
+        # Generates tags for local date and local time
+        tags["localdate"], tags["localtime"] = self.convert_utc_to_local(
+            tags["utcdate"], tags["utctime"]
+        )
+        self.interner.intern_tags(tags, self.INTERNED_TAGS)
+        tags["game_id"] = json_game["id"]
+        tags["currentposition"] = json_game["lastFen"]
+
+        # The reason the game ended is given in the last comment of the movetext,
+        # which is found without tokenizing the moves
+        comment = movetext.last_comment
+        if comment is not None:
+            tags["ending"] = self.extract_ending_from_comment(comment.strip())
+        else:
+            tags["ending"] = None
+
+        # The parser user is white if white's name matches, and black otherwise, as
+        # in record_from_lean_json
+        me = "white" if tags["white"].lower() == self.username.lower() else "black"
+        if "winner" in json_game:
+            if json_game["winner"] == me:
+                tags["result"] = "win"
             else:
-                tags["result"] = "draw"
+                tags["result"] = "loss"
+        else:
+            tags["result"] = "draw"
 
-            if tags["ending"]:
-                self.pgn_tags.append(tags)
+        if me == "white":
+            try:
+                tags["elodiff"] = tags["whiteratingdiff"]
+            except KeyError:
+                tags["elodiff"] = None
+        else:
+            try:
+                tags["elodiff"] = tags["blackratingdiff"]
+            except KeyError:
+                tags["elodiff"] = None
 
-            if tags["white"] == "seanyseand":
-                try:
-                    tags["elodiff"] = tags["whiteratingdiff"]
-                except KeyError:
-                    tags["elodiff"] = None
+        # Parses time control information
+        if tags["timecontrol"] == "-":
+            tags["timecategory"] = "daily"
+            tags["increment"] = "n/a"
+        else:
+            time_split = tags["timecontrol"].split("+")
+            time = int(time_split[0])
+            increment = int(time_split[1])
+            if time >= 600:
+                tags["timecategory"] = "rapid"
+            elif 60 < time < 600:
+                tags["timecategory"] = "blitz"
             else:
-                try:
-                    tags["elodiff"] = tags["blackratingdiff"]
-                except KeyError:
-                    tags["elodiff"] = None
-
-            # Parses time control information
-            if tags["timecontrol"] == "-":
-                tags["timecategory"] = "daily"
-                tags["increment"] = "n/a"
+                tags["timecategory"] = "bullet"
+
+            if increment:
+                tags["increment"] = "yes"
             else:
-                time_split = tags["timecontrol"].split("+")
-                time = int(time_split[0])
-                increment = int(time_split[1])
-                if time >= 600:
-                    tags["timecategory"] = "rapid"
-                elif 60 < time < 600:
-                    tags["timecategory"] = "blitz"
-                else:
-                    tags["timecategory"] = "bullet"
+                tags["increment"] = "no"
 
-                if increment:
-                    tags["increment"] = "yes"
-                else:
-                    tags["increment"] = "no"
+        return tags
+
+    def iter_pgn_tags(self, json_games, lazy: bool = False):
+        """
+        Generator that turns a stream of exported games into tag dicts one game at a
+        time. Games without a recognised ending (e.g. aborted games) are skipped.
+        See _json_to_tags for lazy.
+        """
+        for json_game in json_games:
+            tags = self._json_to_tags(json_game, lazy)
+            if tags["ending"]:
+                yield tags
+
+    def record_from_lean_json(self, json_game) -> GameRecord:
+        """
+        Builds a GameRecord straight from the fields of a game exported with
+        lean=True: no PGN is parsed and the ending comes from the game status
+        rather than from the last comment of the movetext. Returns None for games
+        without a recognised ending (e.g. aborted games).
+
+        The export has no opening or termination fields, so eco and termination
+        are None.
+        """
+        ending = self.STATUS_ENDINGS.get(json_game["status"])
+        if ending is None:
+            return None
+        players = json_game["players"]
+        intern = self.interner.intern
+        white = intern(players["white"].get("user", {}).get("name"))
+        black = intern(players["black"].get("user", {}).get("name"))
+        if white is not None and white.lower() == self.username.lower():
+            me = players["white"]
+        else:
+            me = players["black"]
+        winner = json_game.get("winner")
+        if winner is None:
+            result, result_token = Result.DRAW, "1/2-1/2"
+        else:
+            result = Result.WIN if players[winner] is me else Result.LOSS
+            result_token = "1-0" if winner == "white" else "0-1"
+
+        clock = json_game.get("clock")
+        if clock is None:
+            time_control, time_category, increment = "-", TimeCategory.DAILY, None
+        else:
+            initial = clock["initial"]
+            time_control = f"{initial}+{clock['increment']}"
+            if initial >= 600:
+                time_category = TimeCategory.RAPID
+            elif 60 < initial < 600:
+                time_category = TimeCategory.BLITZ
+            else:
+                time_category = TimeCategory.BULLET
+            increment = clock["increment"] > 0
+
+        start = datetime.fromtimestamp(json_game["createdAt"] / 1000, tz=timezone.utc)
+        local_date, local_time = self.converter.convert(
+            f"{start:%Y.%m.%d}", f"{start:%H:%M:%S}"
+        )
+        return GameRecord(
+            site=f"https://lichess.org/{json_game['id']}",
+            game_id=json_game["id"],
+            event=intern(
+                f"{'Rated' if json_game.get('rated') else 'Casual'} "
+                f"{json_game.get('speed', '').capitalize()} game"
+            ),
+            white=white,
+            black=black,
+            whiteelo=players["white"].get("rating"),
+            blackelo=players["black"].get("rating"),
+            result=result,
+            ending=ending,
+            elodiff=me.get("ratingDiff"),
+            timecontrol=intern(time_control),
+            timecategory=time_category,
+            increment=increment,
+            termination=None,
+            eco=None,
+            start=start.replace(microsecond=0),
+            local_start=_parse_local_datetime(local_date, local_time),
+            movetext=SANMovetext(
+                f"{json_game.get('moves', '')} {result_token}",
+                clocks=array("I", json_game.get("clocks", ())),
+            ),
+        )
+
+    def iter_lean_records(self, json_games):
+        """
+        Generator stage that turns games exported with lean=True into GameRecords,
+        skipping games without a recognised ending.
+        """
+        for json_game in json_games:
+            record = self.record_from_lean_json(json_game)
+            if record is not None:
+                yield record
+
+    def iter_current_month_tags(self):
+        """
+        Streams the current month's export straight into tag extraction, so records
+        are produced while the rest of the export is still downloading.
+        """
+        return self.iter_pgn_tags(
+            self._iter_window_jsons(*self._current_month_window(), project=True)
+        )
+
+    build_records = _build_records
+    build_columns = _build_columns
+
+    def pipeline(self, source=None, sink=None, records=False, lean=False):
+        """
+        Streams exported games through extract -> enrich -> sink without building
+        any intermediate list. source is any iterable of game dicts, such as
+        iter_range_jsons(...), and defaults to the current month's export. See
+        run_pipeline for what sink does. With records=True the pipeline produces
+        GameRecords instead of tag dicts.
 
-            # Determines number of moves in the game
-            moves_list = re.split(r"\d+\.", tags["moves"])
-            tags["nmoves"] = len([move for move in moves_list if move.strip()])
+        lean=True expects (and by default fetches) a lean export and always
+        produces GameRecords, built by record_from_lean_json.
+        """
+        if source is None:
+            source = self._iter_window_jsons(
+                *self._current_month_window(), lean, project=True
+            )
+        if lean:
+            return run_pipeline(source, self.iter_lean_records, sink=sink)
+        stages = [partial(self.iter_pgn_tags, lazy=records)]
+        if records:
+            stages.append(iter_records)
+        return run_pipeline(source, *stages, sink=sink)
 
+    def convert_json_list_to_pgn_list(self):
+        self.pgn_tags.extend(self.iter_pgn_tags(self.json_list))
         return self
 
     def extract_ending_from_pgn(self, moves):
-        pattern = re.compile(r"{([^{}]+)}")
         try:
-            ending = re.findall(pattern, moves)[-1]
+            ending = self.COMMENT_PATTERN.findall(moves)[-1]
         except IndexError:
             return None
+        return self.extract_ending_from_comment(ending)
+
+    def extract_ending_from_comment(self, ending):
         if "resigns" in ending:
             return "resignation"
         elif "checkmate" in ending:
@@ -356,5 +3190,5 @@ class LichessParser:
             return "time"
         elif "stalemate" in ending:
             return "stalemate"
-        elif ("Draw" or "draw") in ending:
+        elif "Draw" in ending or "draw" in ending:
             return "draw"